@@ -19,16 +19,11 @@
     https://www.ilo.org/wcmsp5/groups/public/---ed_protect/---protrav/---travail/documents/publication/wcms_491374.pdf
 '''
 
-import simpy, random, enum, itertools, os, logging
-from simpy.util import start_delayed
-from pprint import pprint
-from scipy.stats import beta as betavariate
-from simpy.events import AllOf
-from statsmodels.tsa.statespace.structural import UnobservedComponents
-from scipy.stats import boxcox
-from scipy.special import inv_boxcox
+import simpy, random, enum, itertools, os, logging, math, array, functools
 import pandas as pd
 import numpy as np
+from record_log import (RecordLog, QUEUE_TIME_STAT_DTYPE,
+    QUEUE_STATUS_DTYPE, NUM_AVAILABLE_DTYPE)
 from dataclasses import dataclass
 import datetime
 
@@ -40,6 +35,10 @@ logging.basicConfig(
     filename='debug.log'
 )
 
+# level ERROR above leaves DEBUG False, so the banners around every
+# sign in, meal break and interrupt are skipped without being formatted
+DEBUG = logging.getLogger().isEnabledFor(logging.DEBUG)
+
 
 NOV_INTERARRIVALS = os.path.expanduser(
     '~/csrp/openup-queue-simulation/real_interarrivals_nov.csv')
@@ -64,7 +63,7 @@ MAX_SIMULTANEOUS_CHATS = {
 }    
 
 SEED = 728                                  # for seeding the global sudo-random generator
-THINNING_SEEDS = (308, 408)                 # for seeding the thing algo sudo-random generator
+ARRIVAL_SEED = 308                          # for seeding the arrival process sudo-random generator
 
 MINUTES_PER_DAY = 24 * MINUTES_PER_HOUR     # 1440 minutes per day
 NUM_SIMULATION_DAYS = 30
@@ -77,11 +76,18 @@ POSTCHAT_FILLOUT_TIME = 20                  # time to fill out counsellor postch
 MEAL_BREAK_DURATION = 60                    # 60 minute meal break
 LAST_CASE_CUTOFF = 30                       # do not assign any more cases 30 minutes before signoff
 
-LEN_CIRCULAR_ARRAY = 20000                  # length of circular array
+SAMPLE_BATCH_SIZE = 4096                    # number of random variates drawn at a time
 MAX_CHAT_DURATION = 60 * 11                 # longest chat duration is 11 hours (from OpenUp 1.0)
 
 VALIDATE_CHAT_THRESHOLD = 7.5               # time elapsed in minutes to have a pingpong>=4 
 
+
+def hour_of_day(t):
+    '''
+    hour of the day (0-23) at simulation time t, for logging
+    '''
+    return int(t // MINUTES_PER_HOUR) % 24
+
 ################################################################################
 # Enums, structs and constants
 ################################################################################
@@ -163,12 +169,45 @@ class CounsellorShift:
     end: int            # end time of shift
     num_workers: int    # number of workers in shift
 
-    
-    @property
+    # shift constants below are derived once, on first use
+    # (shifts are not modified once set up)
+
+    @functools.cached_property
+    def key(self):
+        '''
+        (role, shift) key into ServiceOperation.counsellors
+        '''
+        return (self.role, self.shift)
+
+    @functools.cached_property
+    def shift_index(self):
+        '''
+        position of the shift in Shifts, to index per-shift lists
+        '''
+        return list(Shifts).index(self.shift)
+
+    @functools.cached_property
     def duration(self):
         return int(self.end - self.start)
 
-    @property
+    @functools.cached_property
+    def total_procs(self):
+        '''
+        total number of counsellor processes in shift
+        '''
+        return self.num_workers * self.role.num_processes
+
+    @functools.cached_property
+    def first_signout(self):
+        '''
+        delay until the first sign out, taking the mod to deal with
+        first initialized graveyard or special shifts (edge cases)
+        '''
+        if self.shift is Shifts.GRAVEYARD and self.role is Roles.VOLUNTEER:
+            return self.end
+        return self.end % MINUTES_PER_DAY
+
+    @functools.cached_property
     def meal_start(self):
         '''
         define lunch as the midpoint of shift
@@ -306,6 +345,11 @@ class ExpectedArrivals:
     '''
 
     def __init__(self, ts_period=12, num_harmonics=6):
+        # imported here, as only the forecast needs them and statsmodels
+        # is slow to import
+        from statsmodels.tsa.statespace.structural import UnobservedComponents
+        from scipy.stats import boxcox
+
         # load time series of interarrivals (specified in SECONDS)
         df = pd.read_csv(
             INTERARRIVALS_FILE, index_col=0, parse_dates=['ds'])
@@ -361,7 +405,12 @@ class ExpectedArrivals:
         
 
         # must be specified in this order to match ArrivalRateType enum values
-        self.expected_arrival_rate = [mean, lower, upper]
+        # rates are stored as flat arrays of doubles, so the arrival
+        # process can read them by position without going through pandas
+        self.expected_arrival_rate = [
+            array.array('d', np.asarray(x, dtype=np.float64))
+            for x in (mean, lower, upper)
+        ]
         self.size = len(mean)
 
     #---------------------------------------------------------------------------
@@ -419,6 +468,9 @@ class Counsellor:
     and an adhoc duty shift (if available)
     '''
 
+    __slots__ = ('env', 'counsellor_id', 'counsellor_shift', 'client_id',
+        'user_proc')
+
     def __init__(self, env, counsellor_id, counsellor_shift):
         '''
         param:
@@ -430,23 +482,12 @@ class Counsellor:
         self.env = env
         self.counsellor_id = counsellor_id
         self.counsellor_shift = counsellor_shift
-        self.client_id = None # stores client id for interrupting chats
-
-    ############################################################################
-    # Properties (for encapsulation)
-    ############################################################################
-
-    @property
-    def client_id(self):
-        return self.__client_id
-
-    @client_id.setter
-    def client_id(self, value):
-        if isinstance(value, (int, type(None) ) ):
-            self.__client_id = value
+        self.client_id = None # stores client (user) id for interrupting chats
+        self.user_proc = None # the client's user process, to interrupt
 
     def reset(self):
         self.client_id = None
+        self.user_proc = None
 
 #--------------------------------------------------------end of Counsellor class
 
@@ -505,10 +546,8 @@ class ServiceOperation:
             self.interarrivals = self.read_interarrival_time()
         else:
             self.interarrivals = None
-            # seed for thinning algorithm
-            self.thinning_random = (random.Random(), random.Random() )
-            self.thinning_random[0].seed(THINNING_SEEDS[0])
-            self.thinning_random[1].seed(THINNING_SEEDS[1])
+            # seeded stream for the arrival process
+            self.arrival_random = random.Random(ARRIVAL_SEED)
             self.arrival_rate_type = arrival_rate_type
 
         self.arrivals = arrivals
@@ -521,7 +560,7 @@ class ServiceOperation:
         self.__meal_break = meal_break_duration
 
 
-        # counters and flags (also see properties section)
+        # counters and flags
         self.num_users = 0 # to be changed in create_users()
         self.num_users_TOS_accepted = 0
         self.num_users_TOS_rejected = 0
@@ -535,35 +574,57 @@ class ServiceOperation:
         self.served_g_valid = 0
 
 
-        self.users_in_system = []
-        self.user_queue = []
-        self.queue_status = []
-        self.queue_time_stats = []
-        self.renege_time_stats = []
+        self.users_in_system = {} # insertion ordered, O(1) removal
+        self.user_queue = {} # insertion ordered, O(1) removal
+        self.__queue_status = RecordLog(QUEUE_STATUS_DTYPE)
+        self.__queue_time_stats = RecordLog(QUEUE_TIME_STAT_DTYPE)
+        self.__renege_time_stats = RecordLog(QUEUE_TIME_STAT_DTYPE)
 
-        self.queue_time_stats_transfer = []  # for users sent back to queue
-        self.renege_time_stats_transfer = [] # for users sent back to queue
+        # for users sent back to queue
+        self.__queue_time_stats_transfer = RecordLog(QUEUE_TIME_STAT_DTYPE)
+        self.__renege_time_stats_transfer = RecordLog(QUEUE_TIME_STAT_DTYPE)
 
-        self.case_chat_time = []
+        self.__case_chat_time = RecordLog(np.float64)
 
-        self.num_available_counsellor_processes = []
+        # batches of unit exponential variates, for patience
+        self.patience_samples = []
 
-        self.user_queue_max_length = 0
+        # batches of chat duration variates, keyed by distribution parameters
+        self.chat_duration_samples = {}
 
+        # roles that may take up a case of each risklevel - volunteers
+        # do not take high risk cases, duty officers take only those
+        self.roles_by_risklevel = {}
+        for risk in Risklevels:
+            if risk in [Risklevels.HIGH, Risklevels.CRISIS]:
+                self.roles_by_risklevel[risk] = frozenset(
+                    r for r in Roles if r is not Roles.VOLUNTEER)
+            else:
+                self.roles_by_risklevel[risk] = frozenset(
+                    r for r in Roles if r is not Roles.DUTY_OFFICER)
+
+        # chat duration (alpha, beta, shape) parameters, resolved once
+        # per user status and risklevel
+        self.chat_duration_params = {}
+        for risk in Risklevels:
+            self.chat_duration_params[Users.REPEATED, risk] = (
+                risk.alpha_repeated_user,
+                risk.beta_repeated_user,
+                risk.shape_repeated_user)
+            self.chat_duration_params[Users.NON_REPEATED, risk] = (
+                risk.alpha_non_repeated_user,
+                risk.beta_non_repeated_user,
+                risk.shape_non_repeated_user)
+
+        self.__num_available = RecordLog(NUM_AVAILABLE_DTYPE)
+
+        self.user_queue_max_length = 0
 
-        self.current_shift_start = {
-            Shifts.GRAVEYARD: None,
-            Shifts.AM: None,
-            Shifts.PM: None,
-            Shifts.SPECIAL: None
-        }
 
-        self.current_shift_end = {
-            Shifts.GRAVEYARD: None,
-            Shifts.AM: None,
-            Shifts.PM: None,
-            Shifts.SPECIAL: None
-        }
+        # indexed by CounsellorShift.shift_index, as enum members
+        # hash through a python level __hash__
+        self.current_shift_start = [None] * len(Shifts)
+        self.current_shift_end = [None] * len(Shifts)
 
 
         # self.processes = {} # the main idle process
@@ -590,20 +651,16 @@ class ServiceOperation:
         
 
         
+        # keyed by CounsellorShift.key, i.e. (role, shift)
         self.counsellors = {}
-        for r in Roles:
-            self.counsellors[r] = {}
 
         for s in volunteer_shifts:
-            self.counsellors[s.role][s.shift] = []
             self.list_counsellers(s)
 
         for s in duty_officer_shifts:
-            self.counsellors[s.role][s.shift] = []
             self.list_counsellers(s)
 
         for s in social_worker_shifts:
-            self.counsellors[s.role][s.shift] = []
             self.list_counsellers(s)
 
 
@@ -650,7 +707,6 @@ class ServiceOperation:
 
         # generate users
         # this process will not be disrupted even when counsellors sign out
-        self.user_handler = [None] * LEN_CIRCULAR_ARRAY
         self.user_procs = self.env.process(self.create_users() )
         # logging.debug(self.user_procs)
 
@@ -660,77 +716,39 @@ class ServiceOperation:
     ############################################################################
 
     @property
-    def user_queue_max_length(self):
-        return self.__user_queue_max_length
-
-    @property
-    def num_users(self):
-        return self.__num_users
+    def num_available_counsellor_processes(self):
+        # (time, number of available counsellor processes) tuples
+        return self.__num_available.view().tolist()
 
     @property
-    def reneged(self):
-        return self.__reneged
+    def queue_status(self):
+        # structured array of (weekday, hour, queue_length) records
+        return self.__queue_status.view()
 
     @property
-    def reneged_during_transfer(self):
-        return self.__reneged_during_transfer
+    def case_chat_time(self):
+        # array of the cumulative chat time of every finished case
+        return self.__case_chat_time.view()
 
     @property
-    def served(self):
-        return self.__served
+    def queue_time_stats(self):
+        # structured array of (weekday, hour, time_spent_in_queue) records
+        return self.__queue_time_stats.view()
 
     @property
-    def served_g_repeated(self):
-        return self.__served_g_repeated
+    def renege_time_stats(self):
+        # structured array of (weekday, hour, time_spent_in_queue) records
+        return self.__renege_time_stats.view()
 
     @property
-    def served_g_regular(self):
-        return self.__served_g_regular
+    def queue_time_stats_transfer(self):
+        # structured array of (weekday, hour, time_spent_in_queue) records
+        return self.__queue_time_stats_transfer.view()
 
     @property
-    def served_g_valid(self):
-        return self.__served_g_valid
-    
-    @property
-    def case_chat_time(self):
-        return self.__case_chat_time
-    
-
-    @user_queue_max_length.setter
-    def user_queue_max_length(self, value):
-        self.__user_queue_max_length = value
-
-    @num_users.setter
-    def num_users(self, value):
-        self.__num_users = value
-
-    @reneged.setter
-    def reneged(self, value):
-        self.__reneged = value
-
-    @reneged_during_transfer.setter
-    def reneged_during_transfer(self, value):
-        self.__reneged_during_transfer = value
-
-    @served.setter
-    def served(self, value):
-        self.__served = value
-
-    @served_g_repeated.setter
-    def served_g_repeated(self, value):
-        self.__served_g_repeated = value
-
-    @served_g_regular.setter
-    def served_g_regular(self, value):
-        self.__served_g_regular = value
-
-    @served_g_valid.setter
-    def served_g_valid(self, value):
-        self.__served_g_valid = value   
-
-    @case_chat_time.setter
-    def case_chat_time(self, value):
-        self.__case_chat_time = value
+    def renege_time_stats_transfer(self):
+        # structured array of (weekday, hour, time_spent_in_queue) records
+        return self.__renege_time_stats_transfer.view()
 
     ############################################################################
     # counsellor related functions
@@ -744,15 +762,91 @@ class ServiceOperation:
             counsellor_shift - CounsellorShift DataClass
         '''            
 
+        env = self.env
+        counsellors = self.counsellors[counsellor_shift.key] = []
+        id_prefix = f'{counsellor_shift.shift.name}_{counsellor_shift.role.counsellor_type}'
+        num_processes = counsellor_shift.role.num_processes
+
         # signing in involves creating multiple counsellor processes
         for id_ in range(1, counsellor_shift.num_workers+1):
-            for subprocess_num in range(1, counsellor_shift.role.num_processes+1):
-                counsellor_id = f'{counsellor_shift.shift.name}_{counsellor_shift.role.counsellor_type}_{id_}_process_{subprocess_num}'
-                self.counsellors[counsellor_shift.role][counsellor_shift.shift].append(
-                    Counsellor(self.env, counsellor_id, counsellor_shift)
+            for subprocess_num in range(1, num_processes+1):
+                counsellor_id = f'{id_prefix}_{id_}_process_{subprocess_num}'
+                counsellors.append(
+                    Counsellor(env, counsellor_id, counsellor_shift)
                 )
                 
-                # logging.debug(f'list_counsellers shift:{counsellor_shift.shift}\n{self.counsellors[counsellor_shift.role][counsellor_shift.shift]}\n\n')
+                # logging.debug(f'list_counsellers shift:{counsellor_shift.shift}\n{counsellors}\n\n')
+
+    #---------------------------------------------------------------------------
+
+    def withdraw_idle_counsellors(self, counsellor_shift, num_procs):
+        '''
+        subroutine to take idle counsellor processes of a shift and role
+        out of the active store, without filtered store requests
+
+        processes are taken in store order, as a FilterStore get would
+
+        param:
+            counsellor_shift - CounsellorShift DataClass instance
+            num_procs - maximum number of processes to take out
+
+        returns: list of the Counsellor instances taken out
+        '''
+        shift = counsellor_shift.shift
+        role = counsellor_shift.role
+
+        withdrawn = []
+        kept = []
+        for c in self.store_counsellors_active.items:
+            if len(withdrawn) < num_procs and (
+                c.counsellor_shift.shift is shift and
+                c.counsellor_shift.role is role):
+                withdrawn.append(c)
+            else:
+                kept.append(c)
+
+        self.store_counsellors_active.items[:] = kept
+        return withdrawn
+
+    #---------------------------------------------------------------------------
+
+    def deposit_counsellors(self, counsellors):
+        '''
+        subroutine to put counsellor processes in the active store,
+        so the caller waits on all the put events at once rather than
+        yielding them one by one
+
+        param:
+            counsellors - list of Counsellor instances
+
+        returns: an AllOf event triggered once every counsellor is put
+        '''
+        store_put = self.store_counsellors_active.put
+        return simpy.AllOf(self.env,
+            [store_put(counsellor) for counsellor in counsellors])
+
+    #---------------------------------------------------------------------------
+
+    def case_cutoff(self, counsellor):
+        '''
+        store filter for case cutoff (limiting overtime)
+        Conditionals make sure edge cases 
+        (Special and Graveyard) are being dealt with
+
+        param:
+            counsellor - Counsellor instance
+
+        returns: True if the counsellor's shift ends more than
+            LAST_CASE_CUTOFF minutes from now
+        '''
+        current_time = self.env.now
+
+        shift_end = self.current_shift_end[counsellor.counsellor_shift.shift_index]
+        if shift_end is not None:
+            diff = shift_end - current_time
+        else:
+            diff = -current_time
+        return diff > LAST_CASE_CUTOFF
 
     #---------------------------------------------------------------------------
 
@@ -763,31 +857,39 @@ class ServiceOperation:
         param:
             counsellor_shift - CounsellorShift DataClass instance
         '''
-        counsellor_init = True
-        shift_remaining = None
-
+        # per-shift constants, bound once for the daily loop
+        env = self.env
+        shift = counsellor_shift.shift
+        shift_index = counsellor_shift.shift_index
+        counsellors = self.counsellors[counsellor_shift.key]
 
         # start shift immediately if graveyard or special shift to account for edge case
         # otherwise wait until shift begins
         if not counsellor_shift.is_edge_case or (
-            counsellor_shift.shift is Shifts.GRAVEYARD and 
+            shift is Shifts.GRAVEYARD and 
             counsellor_shift.role is Roles.VOLUNTEER):
-            yield self.env.timeout(counsellor_shift.start) # delay for counsellor_shift.start minutes
+            yield env.timeout(counsellor_shift.start) # delay for counsellor_shift.start minutes
             shift_remaining = counsellor_shift.duration
         else:
             shift_remaining = counsellor_shift.end%MINUTES_PER_DAY
-        
 
-        while True:
-            start_shift_time = self.env.now
+        # delays between sign ins - edge cases sign in one more time
+        # counsellor_shift.start minutes after the first sign in,
+        # then every shift repeats every 24 hours
+        first_delays = (counsellor_shift.start,) if counsellor_shift.is_edge_case else ()
+        sign_in_delays = itertools.chain(
+            first_delays, itertools.repeat(MINUTES_PER_DAY) )
 
-            self.current_shift_start[counsellor_shift.shift] = start_shift_time
-            self.current_shift_end[counsellor_shift.shift] = start_shift_time + shift_remaining
+        for delay in sign_in_delays:
+            start_shift_time = env.now
 
-            for counsellor in self.counsellors[counsellor_shift.role][counsellor_shift.shift]:
-                yield self.store_counsellors_active.put(counsellor)
+            self.current_shift_start[shift_index] = start_shift_time
+            self.current_shift_end[shift_index] = start_shift_time + shift_remaining
 
-                if start_shift_time > 0:
+            yield self.deposit_counsellors(counsellors)
+
+            for counsellor in counsellors:
+                if DEBUG and start_shift_time > 0:
                     logging.debug(f'{Colors.GREEN}+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++{Colors.WHITE}')
                     logging.debug(f'{Colors.GREEN}Counsellor {counsellor.counsellor_id} signed in at t = {start_shift_time}({start_shift_time%MINUTES_PER_DAY:.3f}){Colors.WHITE}')
                     logging.debug(f'{Colors.GREEN}+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++{Colors.WHITE}\n')
@@ -795,18 +897,13 @@ class ServiceOperation:
                     # assert start_shift_time % MINUTES_PER_DAY == counsellor_shift.start or start_shift_time == 0
                     # assert counsellor in self.store_counsellors_active.items
 
-            logging.debug(f'Signed in shift:{counsellor_shift.shift.name} at {start_shift_time}({int(((start_shift_time)%MINUTES_PER_DAY)//60)%24}).'
-                f'  There are {len(self.store_counsellors_active.items)} idle SO counsellor processes:')
-            self.log_idle_counsellors_working()
+            if DEBUG:
+                logging.debug(f'Signed in shift:{shift.name} at {start_shift_time}({hour_of_day(start_shift_time)}).'
+                    f'  There are {len(self.store_counsellors_active.items)} idle SO counsellor processes:')
+                self.log_idle_counsellors_working()
 
-            if counsellor_shift.is_edge_case and counsellor_init:
-                # deal with edge case one more time
-                yield self.env.timeout(counsellor_shift.start)
-                shift_remaining = counsellor_shift.duration
-                counsellor_init = False
-            else:
-                # repeat every 24 hours
-                yield self.env.timeout(MINUTES_PER_DAY) 
+            yield env.timeout(delay)
+            shift_remaining = counsellor_shift.duration
 
     #---------------------------------------------------------------------------
 
@@ -818,60 +915,62 @@ class ServiceOperation:
             counsellor_shift - CounsellorShift DataClass
         '''
 
-        total_procs = counsellor_shift.num_workers * counsellor_shift.role.num_processes
+        # per-shift constants, bound once for the daily loop
+        env = self.env
+        shift = counsellor_shift.shift
+        counsellors = self.counsellors[counsellor_shift.key]
+
+        total_procs = counsellor_shift.total_procs
 
         # delay for shift.end minutes
-        # taking the mod to deal with first initialized graveyard or special shifts (edge cases)
-        if counsellor_shift.shift is Shifts.GRAVEYARD and\
-            counsellor_shift.role is Roles.VOLUNTEER:
-            yield self.env.timeout(counsellor_shift.end)
-        else:
-            yield self.env.timeout(counsellor_shift.end % MINUTES_PER_DAY)
+        yield env.timeout(counsellor_shift.first_signout)
 
         while True:
-            counsellors_still_serving = set(self.counsellors[counsellor_shift.role][counsellor_shift.shift]).difference(
-                set(self.store_counsellors_active.items) )
-            if len(counsellors_still_serving) > 0:
-                logging.debug(f'{Colors.BLUE}--------------INCOMPLETE {counsellor_shift.shift.name} {self.env.now} ({self.env.now%MINUTES_PER_DAY})--------------{Colors.WHITE}')
-                # logging.debug([c.counsellor_id for c in self.counsellors[shift]])
-                logging.debug([c.counsellor_id for c in counsellors_still_serving])
-                self.log_idle_counsellors_working()
+            # take the idle processes out of the store - if that is not
+            # all of them, the rest are still serving users
+            # (kept in counsellor list order, so interrupts go out in a fixed order)
+            counsellor_instances = self.withdraw_idle_counsellors(
+                counsellor_shift, total_procs)
+            if len(counsellor_instances) < total_procs:
+                withdrawn = set(counsellor_instances)
+                counsellors_still_serving = [c for c in counsellors if c not in withdrawn]
+
+                if DEBUG:
+                    logging.debug(f'{Colors.BLUE}--------------INCOMPLETE {shift.name} {env.now} ({env.now%MINUTES_PER_DAY})--------------{Colors.WHITE}')
+                    # logging.debug([c.counsellor_id for c in self.counsellors[shift]])
+                    logging.debug([c.counsellor_id for c in counsellors_still_serving])
+                    self.log_idle_counsellors_working()
 
                 try:
                     self.user_procs.interrupt((JobStates.SIGNOUT, counsellors_still_serving) ) # throw an interrupt
-                    logging.debug(f'{Colors.RED}@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@{Colors.WHITE}')
-                    logging.debug(f'@@@@ Interrupt user process handled by {counsellors_still_serving} @@@@')
-                    logging.debug(f'{Colors.RED}@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@{Colors.WHITE}')
+                    if DEBUG:
+                        logging.debug(f'{Colors.RED}@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@{Colors.WHITE}')
+                        logging.debug(f'@@@@ Interrupt user process handled by {counsellors_still_serving} @@@@')
+                        logging.debug(f'{Colors.RED}@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@{Colors.WHITE}')
                 except RuntimeError:
-                    logging.debug(f'{Colors.BLUE}@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@{Colors.WHITE}')
-                    logging.debug(f'@@@@ Cannot interrupt user process handled by {counsellors_still_serving} as it is already completed. @@@@')
-                    logging.debug(f'{Colors.BLUE}@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@{Colors.WHITE}')
-                
-            total_procs_remaining = total_procs - len(counsellors_still_serving)
-            counsellor_procs = [self.store_counsellors_active.get(
-                lambda x: x.counsellor_shift.shift is counsellor_shift.shift and x.counsellor_shift.role is counsellor_shift.role)
-                for _ in range(total_procs_remaining)]
-
-            # wait for all procs
-            counsellor = yield AllOf(self.env, counsellor_procs)
-            counsellor_instances = [counsellor[list(counsellor)[i]] for i in range(total_procs_remaining)]
+                    if DEBUG:
+                        logging.debug(f'{Colors.BLUE}@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@{Colors.WHITE}')
+                        logging.debug(f'@@@@ Cannot interrupt user process handled by {counsellors_still_serving} as it is already completed. @@@@')
+                        logging.debug(f'{Colors.BLUE}@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@{Colors.WHITE}')
 
-            end_shift_time = self.env.now
+            end_shift_time = env.now
 
             for c in counsellor_instances:
                 c.reset() # set break flags
-                logging.debug(f'{Colors.RED}--------------------------------------------------------------------------{Colors.WHITE}')
-                logging.debug(f'{Colors.RED}Counsellor {c.counsellor_id} signed out at t = {end_shift_time:.3f} ({end_shift_time%MINUTES_PER_DAY:.3f}).{Colors.WHITE}')
-                logging.debug(f'{Colors.RED}--------------------------------------------------------------------------{Colors.WHITE}\n')
+                if DEBUG:
+                    logging.debug(f'{Colors.RED}--------------------------------------------------------------------------{Colors.WHITE}')
+                    logging.debug(f'{Colors.RED}Counsellor {c.counsellor_id} signed out at t = {end_shift_time:.3f} ({end_shift_time%MINUTES_PER_DAY:.3f}).{Colors.WHITE}')
+                    logging.debug(f'{Colors.RED}--------------------------------------------------------------------------{Colors.WHITE}\n')
                 # assert end_shift_time % MINUTES_PER_DAY == counsellor_shift.start or end_shift_time == 0
                 # assert c not in self.store_counsellors_active.items            
 
-            logging.debug(f'Signed out shift:{counsellor_shift.shift.name} at {end_shift_time}({int((int(end_shift_time)%MINUTES_PER_DAY)/60)%24}).'
-                f'  There are {len(self.store_counsellors_active.items)} idle SO counsellor processes:\n')
-            self.log_idle_counsellors_working()
+            if DEBUG:
+                logging.debug(f'Signed out shift:{shift.name} at {end_shift_time}({hour_of_day(end_shift_time)}).'
+                    f'  There are {len(self.store_counsellors_active.items)} idle SO counsellor processes:\n')
+                self.log_idle_counsellors_working()
 
             # repeat every 24 hours - overtime
-            yield self.env.timeout(MINUTES_PER_DAY)
+            yield env.timeout(MINUTES_PER_DAY)
 
     #---------------------------------------------------------------------------
 
@@ -883,57 +982,64 @@ class ServiceOperation:
             counsellor_shift - CounsellorShift DataClass instance
         '''
 
-        total_procs = counsellor_shift.num_workers * counsellor_shift.role.num_processes
+        # per-shift constants, bound once for the daily loop
+        env = self.env
+        shift = counsellor_shift.shift
+        counsellors = self.counsellors[counsellor_shift.key]
+
+        total_procs = counsellor_shift.total_procs
 
         # delay until meal break starts
-        yield self.env.timeout(counsellor_shift.meal_start)
+        yield env.timeout(counsellor_shift.meal_start)
 
         while True:
 
-            counsellors_still_serving = set(self.counsellors[counsellor_shift.role][counsellor_shift.shift]).difference(
-                set(self.store_counsellors_active.items) )
-            if len(counsellors_still_serving) > 0:
-                logging.debug(f'{Colors.BLUE}--------------INCOMPLETE {counsellor_shift.shift.name} {self.env.now} ({self.env.now%MINUTES_PER_DAY})--------------{Colors.WHITE}')
-                # logging.debug([c.counsellor_id for c in self.counsellors[counsellor_shift.shift]])
-                logging.debug([c.counsellor_id for c in counsellors_still_serving])
-                self.log_idle_counsellors_working()
+            # take the idle processes out of the store - if that is not
+            # all of them, the rest are still serving users
+            # (kept in counsellor list order, so interrupts go out in a fixed order)
+            counsellor_instances = self.withdraw_idle_counsellors(
+                counsellor_shift, total_procs)
+            if len(counsellor_instances) < total_procs:
+                withdrawn = set(counsellor_instances)
+                counsellors_still_serving = [c for c in counsellors if c not in withdrawn]
+
+                if DEBUG:
+                    logging.debug(f'{Colors.BLUE}--------------INCOMPLETE {shift.name} {env.now} ({env.now%MINUTES_PER_DAY})--------------{Colors.WHITE}')
+                    # logging.debug([c.counsellor_id for c in self.counsellors[shift]])
+                    logging.debug([c.counsellor_id for c in counsellors_still_serving])
+                    self.log_idle_counsellors_working()
 
                 try:
                     self.user_procs.interrupt((JobStates.MEAL_BREAK, counsellors_still_serving) ) # throw an interrupt
-                    logging.debug(f'{Colors.RED}@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@{Colors.WHITE}')
-                    logging.debug(f'@@@@ Interrupt user process handled by {counsellors_still_serving} @@@@')
-                    logging.debug(f'{Colors.RED}@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@{Colors.WHITE}')
+                    if DEBUG:
+                        logging.debug(f'{Colors.RED}@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@{Colors.WHITE}')
+                        logging.debug(f'@@@@ Interrupt user process handled by {counsellors_still_serving} @@@@')
+                        logging.debug(f'{Colors.RED}@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@{Colors.WHITE}')
                 except RuntimeError:
-                    logging.debug(f'{Colors.BLUE}@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@{Colors.WHITE}')
-                    logging.debug(f'@@@@ Cannot interrupt user process handled by {counsellors_still_serving} as it is already completed. @@@@')
-                    logging.debug(f'{Colors.BLUE}@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@{Colors.WHITE}')
-                
-            total_procs_remaining = total_procs - len(counsellors_still_serving)
-            counsellor_procs = [self.store_counsellors_active.get(
-                lambda x: x.counsellor_shift.shift is counsellor_shift.shift and x.counsellor_shift.role is counsellor_shift.role)
-                for _ in range(total_procs_remaining)]
+                    if DEBUG:
+                        logging.debug(f'{Colors.BLUE}@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@{Colors.WHITE}')
+                        logging.debug(f'@@@@ Cannot interrupt user process handled by {counsellors_still_serving} as it is already completed. @@@@')
+                        logging.debug(f'{Colors.BLUE}@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@{Colors.WHITE}')
 
-            # wait for all procs
-            counsellor = yield AllOf(self.env, counsellor_procs)
-            counsellor_instances = [counsellor[list(counsellor)[i]] for i in range(total_procs_remaining)]
-
-            break_init_time = self.env.now
+            break_init_time = env.now
 
             for c in counsellor_instances:
                 c.reset() # set break flags
-                logging.debug(f'{Colors.BLUE}**************************************************************************{Colors.WHITE}')
-                logging.debug(f'{Colors.BLUE}Counsellor {c.counsellor_id} AFK at t = {break_init_time:.3f} ({break_init_time%MINUTES_PER_DAY:.3f}).{Colors.WHITE}')
-                logging.debug(f'{Colors.BLUE}**************************************************************************{Colors.WHITE}\n')
+                if DEBUG:
+                    logging.debug(f'{Colors.BLUE}**************************************************************************{Colors.WHITE}')
+                    logging.debug(f'{Colors.BLUE}Counsellor {c.counsellor_id} AFK at t = {break_init_time:.3f} ({break_init_time%MINUTES_PER_DAY:.3f}).{Colors.WHITE}')
+                    logging.debug(f'{Colors.BLUE}**************************************************************************{Colors.WHITE}\n')
 
                 # assert end_shift_time % MINUTES_PER_DAY == shift.start or end_shift_time == 0
                 # assert c not in self.store_counsellors_active.items            
 
-            logging.debug(f'Shift {counsellor_shift.shift.name} taking meal break at {break_init_time}({int((int(break_init_time)%MINUTES_PER_DAY)/60)%24}).'
-                f'  There are {len(self.store_counsellors_active.items)} idle SO counsellor processes:\n')
-            self.log_idle_counsellors_working()
+            if DEBUG:
+                logging.debug(f'Shift {shift.name} taking meal break at {break_init_time}({hour_of_day(break_init_time)}).'
+                    f'  There are {len(self.store_counsellors_active.items)} idle SO counsellor processes:\n')
+                self.log_idle_counsellors_working()
 
             # repeat every 24 hours
-            yield self.env.timeout(MINUTES_PER_DAY)
+            yield env.timeout(MINUTES_PER_DAY)
 
     #---------------------------------------------------------------------------
 
@@ -945,28 +1051,35 @@ class ServiceOperation:
         counsellor_shift - CounsellorShift DataClass instance
         '''
 
+        # per-shift constants, bound once for the daily loop
+        env = self.env
+        shift = counsellor_shift.shift
+        counsellors = self.counsellors[counsellor_shift.key]
+
         # delay until meal break starts
-        yield self.env.timeout(counsellor_shift.meal_start + self.__meal_break)
+        yield env.timeout(counsellor_shift.meal_start + self.__meal_break)
 
         while True:
-            end_break_time = self.env.now
+            end_break_time = env.now
 
-            for counsellor in self.counsellors[counsellor_shift.role][counsellor_shift.shift]:
-                yield self.store_counsellors_active.put(counsellor)
+            yield self.deposit_counsellors(counsellors)
 
-                logging.debug(f'{Colors.BLUE}##########################################################################{Colors.WHITE}')
-                logging.debug(f'{Colors.BLUE}Counsellor {counsellor.counsellor_id} BAK at t = {end_break_time}({end_break_time%MINUTES_PER_DAY:.3f}){Colors.WHITE}')
-                logging.debug(f'{Colors.BLUE}##########################################################################{Colors.WHITE}\n')
+            for counsellor in counsellors:
+                if DEBUG:
+                    logging.debug(f'{Colors.BLUE}##########################################################################{Colors.WHITE}')
+                    logging.debug(f'{Colors.BLUE}Counsellor {counsellor.counsellor_id} BAK at t = {end_break_time}({end_break_time%MINUTES_PER_DAY:.3f}){Colors.WHITE}')
+                    logging.debug(f'{Colors.BLUE}##########################################################################{Colors.WHITE}\n')
                 
                 # assert start_shift_time % MINUTES_PER_DAY == counsellor_shift.start or start_shift_time == 0
                 # assert counsellor in self.store_counsellors_active.items
 
-            logging.debug(f'Shift {counsellor_shift.shift.name} resumed at {end_break_time}({int(((end_break_time)%MINUTES_PER_DAY)//60)%24}).'
-                f'  There are {len(self.store_counsellors_active.items)} idle SO counsellor processes:')
-            self.log_idle_counsellors_working()
+            if DEBUG:
+                logging.debug(f'Shift {shift.name} resumed at {end_break_time}({hour_of_day(end_break_time)}).'
+                    f'  There are {len(self.store_counsellors_active.items)} idle SO counsellor processes:')
+                self.log_idle_counsellors_working()
 
             # repeat every 24 hours
-            yield self.env.timeout(MINUTES_PER_DAY) 
+            yield env.timeout(MINUTES_PER_DAY) 
 
     ############################################################################
     # user related functions
@@ -984,8 +1097,6 @@ class ServiceOperation:
             # space out incoming users
             # logging.debug(self.env.active_process)
             interarrival_time = self.assign_interarrival_time(i)
-            if interarrival_time is None:
-                continue # skip the rest of the code and move to next iteration
 
             start_time = self.env.now
 
@@ -1000,13 +1111,21 @@ class ServiceOperation:
                         counsellors_to_sign_out = si.cause[-1]
                         cause = si.cause[0]
 
+                        # one interrupt per user process, carrying
+                        # the counsellors leaving it
+                        user_procs_to_interrupt = {}
                         for c in counsellors_to_sign_out:
-                            if c.client_id is not None:
-                                try:
-                                    self.user_handler[c.client_id%LEN_CIRCULAR_ARRAY].interrupt((cause, c) )
-                                except RuntimeError:
+                            if c.user_proc is not None:
+                                user_procs_to_interrupt.setdefault(
+                                    c.user_proc, []).append(c)
+
+                        for user_proc, counsellors in user_procs_to_interrupt.items():
+                            try:
+                                user_proc.interrupt((cause, counsellors) )
+                            except RuntimeError:
+                                if DEBUG:
                                     logging.debug(f'{Colors.BLUE}**************************************************************************{Colors.HEND}')
-                                    logging.debug(f'{Colors.BLUE}User {c.client_id} process cannot be interrupted{Colors.HEND}')
+                                    logging.debug(f'{Colors.BLUE}User {counsellors[0].client_id} process cannot be interrupted{Colors.HEND}')
                                     logging.debug(f'{Colors.BLUE}**************************************************************************{Colors.HEND}\n')
 
                     interarrival_time -= self.env.now - start_time # reset timeout
@@ -1021,21 +1140,21 @@ class ServiceOperation:
             tos_state = self.assign_TOS_acceptance()
             if tos_state == TOS.TOS_ACCEPTED:
                 self.num_users_TOS_accepted += 1
-                self.user_handler[uid%LEN_CIRCULAR_ARRAY] = self.env.process(
-                    self.handle_user(uid)
-                )
+                self.env.process(self.handle_user(uid) )
 
-                logging.debug(f'{Colors.GREEN}**************************************************************************{Colors.HEND}')
-                logging.debug(f'{Colors.GREEN}User {uid} has just accepted TOS.  Chat session created at '
-                    f'{self.env.now:.3f}{Colors.HEND}')
-                logging.debug(f'{Colors.GREEN}**************************************************************************{Colors.HEND}\n')
+                if DEBUG:
+                    logging.debug(f'{Colors.GREEN}**************************************************************************{Colors.HEND}')
+                    logging.debug(f'{Colors.GREEN}User {uid} has just accepted TOS.  Chat session created at '
+                        f'{self.env.now:.3f}{Colors.HEND}')
+                    logging.debug(f'{Colors.GREEN}**************************************************************************{Colors.HEND}\n')
 
             else: # if TOS.TOS_REJECTED
                 self.num_users_TOS_rejected += 1
 
-                logging.debug(f'{Colors.BLUE}**************************************************************************{Colors.HEND}')
-                logging.debug(f'{Colors.BLUE}User {uid} rejected TOS at {self.env.now}{Colors.HEND}')
-                logging.debug(f'{Colors.BLUE}**************************************************************************{Colors.HEND}\n')
+                if DEBUG:
+                    logging.debug(f'{Colors.BLUE}**************************************************************************{Colors.HEND}')
+                    logging.debug(f'{Colors.BLUE}User {uid} rejected TOS at {self.env.now}{Colors.HEND}')
+                    logging.debug(f'{Colors.BLUE}**************************************************************************{Colors.HEND}\n')
 
         # otherwise, do nothing
     #---------------------------------------------------------------------------
@@ -1052,34 +1171,7 @@ class ServiceOperation:
             user_id - user id (integer)
         '''
 
-        # lambda filters
-        def case_cutoff(x):
-            '''
-            lambda filter for case cutoff (limiting overtime)
-            Conditionals make sure edge cases 
-            (Special and Graveyard) are being dealt with
-            '''
-            current_time = self.env.now
-
-            shift_end = self.current_shift_end.get(x.counsellor_shift.shift)
-            if shift_end is not None:
-                diff = shift_end - current_time
-            else:
-                diff = -current_time
-            return diff > LAST_CASE_CUTOFF
-
-
-        def get_counsellor(x, risk):
-            '''
-            lambda filter for get_counsellor
-            '''
-            if risk in [Risklevels.HIGH, Risklevels.CRISIS]:
-                return x.counsellor_shift.role in [
-                    r for r in Roles if r is not Roles.VOLUNTEER]
-
-            return x.counsellor_shift.role in [
-                r for r in Roles if r is not Roles.DUTY_OFFICER]
-
+        case_cutoff = self.case_cutoff
 
         user_status = self.assign_user_status()
         risklevel = self.assign_risklevel(user_status)
@@ -1090,22 +1182,13 @@ class ServiceOperation:
         #     user_status.shape_renege_time,
         #     user_status.loc_renege_time)
 
-        if user_status is Users.REPEATED:
-            chat_duration = self.assign_chat_duration(
-                risklevel.alpha_repeated_user,
-                risklevel.beta_repeated_user,
-                risklevel.shape_repeated_user
-            )
-        else:
-            chat_duration = self.assign_chat_duration(
-                risklevel.alpha_non_repeated_user,
-                risklevel.beta_non_repeated_user,
-                risklevel.shape_non_repeated_user
-            )
+        chat_duration = self.assign_chat_duration(
+            *self.chat_duration_params[user_status, risklevel])
+        roles = self.roles_by_risklevel[risklevel]
 
         transfer_case = False # if process is interrupted, this flag is set to True
-        self.users_in_system.append(user_id)
-        self.user_queue.append(user_id)
+        self.users_in_system[user_id] = None
+        self.user_queue[user_id] = None
         cumulative_chat_time = 0
         chat_finished = False
 
@@ -1117,7 +1200,7 @@ class ServiceOperation:
             # get only counsellors matching risklevel to role
             # and remaining shift > LAST_CASE_CUTOFF
             counsellor = self.store_counsellors_active.get(
-                lambda x: case_cutoff(x) and get_counsellor(x, risklevel)
+                lambda x: x.counsellor_shift.role in roles and case_cutoff(x)
             )
 
             results = yield counsellor | self.env.timeout(renege_time)
@@ -1130,71 +1213,56 @@ class ServiceOperation:
             hour = int(current_day_minutes / MINUTES_PER_HOUR)
             if counsellor in results:
                 if not transfer_case:
-                    self.queue_time_stats.append({
-                        'weekday': weekday,
-                        'hour': hour,
-                        'time_spent_in_queue': time_spent_in_queue,
-                    })
+                    self.__queue_time_stats.append(
+                        (weekday, hour, time_spent_in_queue) )
                 else:
-                    self.queue_time_stats_transfer.append({
-                        'weekday': weekday,
-                        'hour': hour,
-                        'time_spent_in_queue': time_spent_in_queue,
-                    })
+                    self.__queue_time_stats_transfer.append(
+                        (weekday, hour, time_spent_in_queue) )
 
             else:
                 if not transfer_case:
-                    self.renege_time_stats.append({
-                        'weekday': weekday,
-                        'hour': hour,
-                        'time_spent_in_queue': renege_time,
-                    })
+                    self.__renege_time_stats.append(
+                        (weekday, hour, renege_time) )
                 else:
-                    self.renege_time_stats_transfer.append({
-                        'weekday': weekday,
-                        'hour': hour,
-                        'time_spent_in_queue': renege_time,
-                    })
+                    self.__renege_time_stats_transfer.append(
+                        (weekday, hour, renege_time) )
 
 
             # dequeue user in the waiting queue
-            self.user_queue.remove(user_id) 
+            del self.user_queue[user_id]
             current_user_queue_length = len(self.user_queue)
 
             # update maximum user queue length
             if current_user_queue_length > self.user_queue_max_length:
                 self.user_queue_max_length = current_user_queue_length
 
-                logging.debug(f'Updated max queue length to '
-                    f'{self.user_queue_max_length}.\n'
-                    f'User Queue: {self.user_queue}\n\n\n')
+                if DEBUG:
+                    logging.debug(f'Updated max queue length to '
+                        f'{self.user_queue_max_length}.\n'
+                        f'User Queue: {list(self.user_queue)}\n\n\n')
 
 
             # update queue status
+            # (weekday and hour are those of current_time, taken above -
+            # no time has passed since)
             if current_user_queue_length >= QUEUE_THRESHOLD:
-                current_time = self.env.now
-                current_day_minutes = int(current_time) % MINUTES_PER_DAY
-                weekday = int(current_time / MINUTES_PER_DAY) % DAYS_IN_WEEK
-                hour = int(current_day_minutes / MINUTES_PER_HOUR)
-
-                logging.debug(
-                    f'Weekday: {weekday} - '
-                    f'Hour: {hour}, '
-                    f'Queue Length: {current_user_queue_length}'
-                )
+                if DEBUG:
+                    logging.debug(
+                        f'Weekday: {weekday} - '
+                        f'Hour: {hour}, '
+                        f'Queue Length: {current_user_queue_length}'
+                    )
 
-                self.queue_status.append({
-                    'weekday': weekday,
-                    'hour': hour,
-                    'queue_length': current_user_queue_length
-                })
+                self.__queue_status.append(
+                    (weekday, hour, current_user_queue_length) )
 
-            logging.debug(f'Current User Queue contains: {self.user_queue}')
+            if DEBUG:
+                logging.debug(f'Current User Queue contains: {list(self.user_queue)}')
 
 
             # store number of available counsellor processes at current timestamp
-            self.num_available_counsellor_processes.append(
-                (self.env.now, len(self.store_counsellors_active.items) )
+            self.__num_available.append(
+                (current_time, len(self.store_counsellors_active.items) )
             )
                 
 
@@ -1203,40 +1271,45 @@ class ServiceOperation:
                 counsellor.cancel() # cancel counsellor request
 
                 # remove user from system record
-                self.users_in_system.remove(user_id)
+                del self.users_in_system[user_id]
                 if not transfer_case:
                     self.reneged += 1 # update counter
-                    log_string = f'{Colors.HBLUE}No counsellor picked up this case{Colors.HEND}'
+                    if DEBUG:
+                        log_string = f'{Colors.HBLUE}No counsellor picked up this case{Colors.HEND}'
                 else:
                     self.reneged_during_transfer += 1
-                    self.case_chat_time.append(cumulative_chat_time)
+                    self.__case_chat_time.append(cumulative_chat_time)
                     if cumulative_chat_time >= self.valid_chat_threshold:
                         self.served_g_valid += 1
                     
 
-                    log_string = f'{Colors.HBLUE}The session lasted {cumulative_chat_time:.3f} minutes.\n\n{Colors.HEND}'
+                    if DEBUG:
+                        log_string = f'{Colors.HBLUE}The session lasted {cumulative_chat_time:.3f} minutes.\n\n{Colors.HEND}'
 
-                logging.debug(f'{Colors.HRED}**************************************************************************{Colors.HEND}')
-                logging.debug(f'{Colors.HRED}User {user_id} reneged after '
-                    f'spending t = {renege_time:.3f} minutes in the queue.{Colors.HEND}')
-                logging.debug(log_string)
-                logging.debug(f'{Colors.HRED}**************************************************************************{Colors.HEND}\n')
+                if DEBUG:
+                    logging.debug(f'{Colors.HRED}**************************************************************************{Colors.HEND}')
+                    logging.debug(f'{Colors.HRED}User {user_id} reneged after '
+                        f'spending t = {renege_time:.3f} minutes in the queue.{Colors.HEND}')
+                    logging.debug(log_string)
+                    logging.debug(f'{Colors.HRED}**************************************************************************{Colors.HEND}\n')
 
-                logging.debug(f'Users in system: {self.users_in_system}')
+                    logging.debug(f'Users in system: {list(self.users_in_system)}')
 
                 chat_duration = 0
 
 
             else: # if counsellor takes in a user
                 chat_start_time = self.env.now
-                counsellor_instance = results[list(results)[0]] # unpack the counsellor instance
+                counsellor_instance = next(iter(results.values() )) # unpack the counsellor instance
                 counsellor_instance.client_id = user_id
+                counsellor_instance.user_proc = self.env.active_process
 
 
-                logging.debug(f'{Colors.HGREEN}**************************************************************************{Colors.HEND}')
-                logging.debug(f'{Colors.HGREEN}User {user_id} is assigned to '
-                    f'{counsellor_instance.counsellor_id} at {chat_start_time:.3f}{Colors.HEND}')
-                logging.debug(f'{Colors.HGREEN}**************************************************************************{Colors.HEND}\n')
+                if DEBUG:
+                    logging.debug(f'{Colors.HGREEN}**************************************************************************{Colors.HEND}')
+                    logging.debug(f'{Colors.HGREEN}User {user_id} is assigned to '
+                        f'{counsellor_instance.counsellor_id} at {chat_start_time:.3f}{Colors.HEND}')
+                    logging.debug(f'{Colors.HGREEN}**************************************************************************{Colors.HEND}\n')
 
 
                 if not transfer_case:  
@@ -1262,8 +1335,8 @@ class ServiceOperation:
                 except simpy.Interrupt as si:
                     if isinstance(si.cause, tuple) and si.cause[0] in [JobStates.SIGNOUT, JobStates.MEAL_BREAK]:
 
-                        counsellor_to_sign_out = si.cause[-1]
-                        if counsellor_instance is counsellor_to_sign_out:
+                        counsellors_to_sign_out = si.cause[-1]
+                        if counsellor_instance in counsellors_to_sign_out:
 
                             if chat_complete is True:
                                 elapsed = chat_duration
@@ -1278,27 +1351,31 @@ class ServiceOperation:
 
                             if chat_duration > 0: 
                                 transfer_case = True # attempt to transfer case
-                                self.user_queue.append(user_id) # put user back into queue
-                                log_string = f'{Colors.HBLUE}Transferring User {user_id} to another counsellor.{Colors.HEND}. Remaining: {chat_duration:.3f}.  cumulative_chat_time: {cumulative_chat_time}'
+                                self.user_queue[user_id] = None # put user back into queue
+                                if DEBUG:
+                                    log_string = f'{Colors.HBLUE}Transferring User {user_id} to another counsellor.{Colors.HEND}. Remaining: {chat_duration:.3f}.  cumulative_chat_time: {cumulative_chat_time}'
 
                             else:
                                 # remove user from system record
-                                self.users_in_system.remove(user_id)
-                                logging.debug(f'Users in system: {self.users_in_system}')
+                                del self.users_in_system[user_id]
+                                if DEBUG:
+                                    logging.debug(f'Users in system: {list(self.users_in_system)}')
 
-                                self.case_chat_time.append(cumulative_chat_time)
+                                self.__case_chat_time.append(cumulative_chat_time)
                                 if cumulative_chat_time >= self.valid_chat_threshold:
                                     self.served_g_valid += 1
 
                                 chat_duration = 0
-                                log_string = f'{Colors.HBLUE}The session lasted {cumulative_chat_time:.3f} minutes.\n\n{Colors.HEND}'
+                                if DEBUG:
+                                    log_string = f'{Colors.HBLUE}The session lasted {cumulative_chat_time:.3f} minutes.\n\n{Colors.HEND}'
 
 
-                            logging.debug(f'{Colors.HBLUE}**************************************************************************{Colors.HEND}')
-                            logging.debug(f'{Colors.HBLUE}Counsellor {counsellor_instance.counsellor_id} left User {user_id}\'s\n'
-                                f'counselling session and {si.cause[0].status} at {self.env.now:.3f} ({self.env.now%MINUTES_PER_DAY:.3f}).\n{Colors.HEND}')
-                            logging.debug(log_string)
-                            logging.debug(f'{Colors.HBLUE}**************************************************************************{Colors.HEND}\n')
+                            if DEBUG:
+                                logging.debug(f'{Colors.HBLUE}**************************************************************************{Colors.HEND}')
+                                logging.debug(f'{Colors.HBLUE}Counsellor {counsellor_instance.counsellor_id} left User {user_id}\'s\n'
+                                    f'counselling session and {si.cause[0].status} at {self.env.now:.3f} ({self.env.now%MINUTES_PER_DAY:.3f}).\n{Colors.HEND}')
+                                logging.debug(log_string)
+                                logging.debug(f'{Colors.HBLUE}**************************************************************************{Colors.HEND}\n')
 
                 
                 else:
@@ -1312,20 +1389,22 @@ class ServiceOperation:
 
                     cumulative_chat_time += elapsed
 
-                    self.case_chat_time.append(cumulative_chat_time)
+                    self.__case_chat_time.append(cumulative_chat_time)
                     if cumulative_chat_time >= self.valid_chat_threshold:
                         self.served_g_valid += 1
 
-                    logging.debug(f'{Colors.HBLUE}**************************************************************************{Colors.HEND}')
-                    logging.debug(f'{Colors.HBLUE}User {user_id}\'s counselling session lasted t = '
-                        f'{cumulative_chat_time:.3f} minutes.\nCounsellor {counsellor_instance.counsellor_id} '
-                        f'is now available at {self.env.now:.3f}.{Colors.HEND}')
-                    logging.debug(f'{Colors.HBLUE}**************************************************************************{Colors.HEND}\n')
+                    if DEBUG:
+                        logging.debug(f'{Colors.HBLUE}**************************************************************************{Colors.HEND}')
+                        logging.debug(f'{Colors.HBLUE}User {user_id}\'s counselling session lasted t = '
+                            f'{cumulative_chat_time:.3f} minutes.\nCounsellor {counsellor_instance.counsellor_id} '
+                            f'is now available at {self.env.now:.3f}.{Colors.HEND}')
+                        logging.debug(f'{Colors.HBLUE}**************************************************************************{Colors.HEND}\n')
 
 
                     # remove user from system record
-                    self.users_in_system.remove(user_id)
-                    logging.debug(f'Users in system: {self.users_in_system}')
+                    del self.users_in_system[user_id]
+                    if DEBUG:
+                        logging.debug(f'Users in system: {list(self.users_in_system)}')
 
                     # counsellor resource is now available
                     yield self.store_counsellors_active.put(counsellor_instance)
@@ -1340,8 +1419,9 @@ class ServiceOperation:
         '''
         Getter to assign interarrival time
         
-        If no interarrivals file is specified, Thinning Algorithm is used to
-        spawn a new interarrival time at an interval-interval basis
+        If no interarrivals file is specified, the interarrival time is
+        drawn from the non-homogeneous Poisson Process whose rate is
+        the expected arrival rate of each ts_period interval of the day
 
         Otherwise, the interarrival time in the file is used.
             
@@ -1361,109 +1441,78 @@ class ServiceOperation:
 
 
 
-        # otherwise run propspective simulations (thinning algorithm)
+        # otherwise run propspective simulations
+        # (rates are read straight from the flat rate arrays, wrapping
+        # around the forecast horizon)
+        arrival_rate_set = self.arrivals.expected_arrival_rate[
+            self.arrival_rate_type]
+        size = self.arrivals.size
+        ts_period = self.arrivals.ts_period
+        interval_length = MINUTES_PER_DAY / ts_period
 
-        def get_max_arrival_rate(day, nearest_two_hours):
-            '''
-            helper function to get the arrival rate lambda within an
-            interval range
-
-            param:  
-                day
-                nearest_two_hours
-            '''
-
-            size = self.arrivals.size
-            arrival_rate_type = self.arrival_rate_type
-            start_idx = int(self.arrivals.ts_period * day + nearest_two_hours)
-            end_idx = start_idx + 1
-            
-            # take the maximum arrival rate within interval
-            arrival_rate_set = self.arrivals.expected_arrival_rate[arrival_rate_type]
-            arrival_rate_1 = arrival_rate_set[start_idx%size]
-            arrival_rate_2 = arrival_rate_set[end_idx%size]
-
-            return max(arrival_rate_1, arrival_rate_2)
-
-        #-----------------------------------------------------------------------
-
-        def get_arrival_rate(day, nearest_two_hours):
-            '''
-            helper function to get the arrival rate lambda at the specific
-            interval
-
-            param:
-                ts_period
-                day
-                nearest_two_hours
-            '''
-            size = self.arrivals.size
-            arrival_rate_type = self.arrival_rate_type
-            current_idx = int(self.arrivals.ts_period * day + nearest_two_hours)
-            arrival_rate_set = self.arrivals.expected_arrival_rate[arrival_rate_type]
-            return arrival_rate_set[current_idx%size]
-
-        #-----------------------------------------------------------------------
-
-        # cast this as integer to get a rough estimate
-        # calculate the nearest hour as an integer
-        # use it to access the mean interarrival time, from which the lambda
-        # can be calculated
+        # the rate is constant within an interval, so the cumulative rate
+        # is piecewise linear - spend a unit exponential variate on it,
+        # interval by interval, until the next arrival is reached
+        # (inverse transform - every draw is an arrival, no thinning)
+        # negative and NaN rates are taken as no arrivals
         current_time = self.env.now
-        current_time_int = int(current_time)
-        current_weekday = int(current_time_int / MINUTES_PER_DAY)
-        current_day_minutes = current_time % MINUTES_PER_DAY
-        nearest_two_hours = int(current_day_minutes / 120)
-
-        # generate the dominant homogeneous Poisson Process
-        max_arrival_rate = get_max_arrival_rate(
-            current_weekday, nearest_two_hours
-        )
-        homo_interarrival_time = self.thinning_random[0].expovariate(max_arrival_rate)
+        remaining = -math.log(1.0 - self.arrival_random.random() )
 
-        # find idx = x+t
-        next_arrival_time = current_time + homo_interarrival_time
-        next_weekday = int(next_arrival_time / MINUTES_PER_DAY)
-        next_arrival_time_day_minutes = next_arrival_time % MINUTES_PER_DAY
-        next_nearest_two_hour_interval = int(next_arrival_time_day_minutes / 120)
-    
-        # calculate lambda(x+t)
-        next_arrival_rate = get_arrival_rate(
-            next_weekday,
-            next_nearest_two_hour_interval
-        )
-
-        # logging.debug(f'Current time: {current_time}')
-        # logging.debug(f'Current weekday: {current_weekday}')
-
-        # logging.debug(f'Next time: {next_arrival_time}')
-        # logging.debug(f'Next weekday: {next_weekday}')
-        # logging.debug(f'Next Minutes day: {next_arrival_time_day_minutes}')
-        # logging.debug(f'Next Nearest two hour: {next_nearest_two_hour_interval}')
-        # logging.debug(f'index: {idx}')
-
-
-        # decide whether to output interarrival time
-        random_num = self.thinning_random[1].uniform(0, 1)
-        if random_num <= (next_arrival_rate / max_arrival_rate):
-            return homo_interarrival_time
-        return None
+        t = current_time
+        num_intervals_scanned = 0
+        while True:
+            # once a full cycle of intervals is scanned, skip the whole
+            # cycles the next arrival is still beyond, so the scan ends
+            # within one more cycle - or never comes if no rate is positive
+            if num_intervals_scanned == size:
+                cycle_arrivals = interval_length * sum(
+                    rate for rate in arrival_rate_set if rate > 0)
+                if cycle_arrivals <= 0:
+                    return math.inf
+                num_cycles = int(remaining // cycle_arrivals)
+                remaining -= num_cycles * cycle_arrivals
+                t += num_cycles * size * interval_length
+                num_intervals_scanned = 0
+            num_intervals_scanned += 1
+
+            weekday = int(t / MINUTES_PER_DAY)
+            interval = int(t % MINUTES_PER_DAY / interval_length)
+            arrival_rate = arrival_rate_set[
+                int(ts_period * weekday + interval) % size]
+            if math.isnan(arrival_rate):
+                arrival_rate = 0.0
+            arrival_rate = max(arrival_rate, 0.0)
+            interval_end = weekday * MINUTES_PER_DAY + (
+                interval + 1) * interval_length
+
+            expected_arrivals = arrival_rate * (interval_end - t)
+            if arrival_rate > 0 and remaining <= expected_arrivals:
+                return t + remaining / arrival_rate - current_time
+
+            remaining -= expected_arrivals
+            t = interval_end
 
     #---------------------------------------------------------------------------
     
     def assign_renege_time(self, mean_patience):
         '''
             Getter to assign patience to user
-            user patience follows a beta distribution
+            user patience follows the exponential distribution
 
             param:
                 mean_patience - mean patience
-                beta - beta shape parameter
-                scale - scale to apply to the standardized beta distribution
 
             returns - renege time
+
+            unit exponential variates are drawn from the global numpy
+            generator in batches, and scaled by the mean patience
         '''
-        renege_time = random.expovariate(1/mean_patience)
+        samples = self.patience_samples
+        if not samples:
+            samples.extend(
+                np.random.standard_exponential(SAMPLE_BATCH_SIZE).tolist() )
+
+        renege_time = samples.pop() * mean_patience
         if renege_time <= 0:
             return 0.1
         return renege_time
@@ -1500,9 +1549,18 @@ class ServiceOperation:
 
         returns - chat duration or MAX_CHAT_DURATION if chat time has exceeded
             service standards
+
+        variates are drawn from the global numpy generator in batches
+        per (alpha, beta) pair, refilling the batch when it runs out
         '''
-        
-        duration = betavariate.rvs(alpha, beta, loc=loc, scale=scale)
+
+        samples = self.chat_duration_samples.get((alpha, beta) )
+        if not samples:
+            samples = np.random.beta(alpha, beta, SAMPLE_BATCH_SIZE).tolist()
+            self.chat_duration_samples[alpha, beta] = samples
+
+        # same scaling as betavariate.rvs(alpha, beta, loc=loc, scale=scale)
+        duration = samples.pop() * scale + loc
         if duration <= 0:
             return 0.1
         elif duration < MAX_CHAT_DURATION:
@@ -1553,21 +1611,27 @@ class ServiceOperation:
     def read_interarrival_time(self):
         '''
         file input function to read in actual interarrivals file      
+
+        returns: tuple of interarrival times, or None if the file
+            cannot be read or parsed
         '''
         try:
-            with open(NOV_INTERARRIVALS, 'r') as f:
-                interarrivals = [float(i) for i in f.readlines() ]
-
-            return interarrivals
+            # parsed in C by numpy, then kept as python floats for scalar access
+            return tuple(
+                np.loadtxt(NOV_INTERARRIVALS, dtype=np.float64, ndmin=1).tolist() )
 
-        except Exception as e:
-            print('Unable to read interarrivals file.')
+        except (OSError, ValueError) as e:
+            print(f'Unable to read interarrivals file: {e}')
+            return None
 
     ############################################################################
     # Debugging functions
     ############################################################################
 
     def log_idle_counsellors_working(self):
+        if not DEBUG:
+            return
+
         logging.debug(f'{Colors.YELLOW}##################################{Colors.WHITE}')
         logging.debug(f'{Colors.YELLOW}Items in Active Counsellors List:{Colors.WHITE}')
         logging.debug(f'{Colors.YELLOW}##################################{Colors.WHITE}')
@@ -17,15 +17,13 @@
     https://www.ilo.org/wcmsp5/groups/public/---ed_protect/---protrav/---travail/documents/publication/wcms_491374.pdf
 '''
 
-import simpy, random, enum, itertools, os, logging
-from simpy.util import start_delayed
-from pprint import pprint
-# from scipy.stats import poisson
-from simpy.events import AllOf
-from statsmodels.tsa.statespace.structural import UnobservedComponents
-from scipy.stats import boxcox
-from scipy.special import inv_boxcox
-import pandas as pd
+import simpy, enum, itertools, os, logging, functools
+import statistics
+from concurrent.futures import ProcessPoolExecutor
+from simpy.events import AllOf, AnyOf
+import numpy as np
+from record_log import (RecordLog, QUEUE_TIME_STAT_DTYPE,
+    QUEUE_STATUS_DTYPE, NUM_AVAILABLE_DTYPE)
 
 
 logging.basicConfig(
@@ -34,6 +32,10 @@ logging.basicConfig(
     filename='debug.log'
 )
 
+# lower the level above to logging.DEBUG to trace counsellors signing
+# in and out and users being served (the trace is built only if so)
+DEBUG = logging.getLogger().isEnabledFor(logging.DEBUG)
+
 
 NOV_INTERARRIVALS = os.path.expanduser(
     '~/csrp/openup-queue-simulation/real_interarrivals_nov.csv')
@@ -57,8 +59,9 @@ MAX_SIMULTANEOUS_CHATS = {
 }    
 
 SEED = 728                                  # for seeding the sudo-random generator
-THINNING_SEED = 305                         # for seeding the thing algo sudo-random generator
 OFFSET = 372
+MAX_TS_INDEX = 1104                         # last forecast index used for thinning
+ARRIVAL_INTERVAL = 120                      # arrival rates are forecast per two-hour interval
 
 MINUTES_PER_DAY = 24 * MINUTES_PER_HOUR     # 1440 minutes per day
 SIMULATION_DURATION = MINUTES_PER_DAY * 30  # currently given as num minutes 
@@ -76,26 +79,13 @@ MEAN_CHAT_DURATION_COUNSELLOR = {
 }
 
 
-CURRENT_SHIFT_START = {
-    'GRAVEYARD': None,
-    'AM': None,
-    'PM': None,
-    'SPECIAL': None
-}
-
-CURRENT_SHIFT_END = {
-    'GRAVEYARD': None,
-    'AM': None,
-    'PM': None,
-    'SPECIAL': None
-}
-
-
 TEA_BREAK_DURATION = 20                     # 20 minute tea break
 MEAL_BREAK_DURATION = 60                    # 60 minute meal break
 DEBRIEF_DURATION = 60                       # 60 minute debriefing session per day
 TRAINING_DURATION = 480                     # 8 hour (480 minute) training session - once per month
 LAST_CASE_CUTOFF = 30                       # do not assign any more cases 30 minutes before signoff
+NUM_USER_WORKERS = 64                       # initial size of the user worker pool
+SAMPLE_BATCH_SIZE = 4096                    # number of samples drawn at once per distribution
 
 NUM_DUTY_OFFICERS = {
     'GRAVEYARD': 1,
@@ -141,6 +131,18 @@ class Colors:
     HBLUE = '\x1b[6;37;44m' 
     HEND = '\x1b[0m'  
 
+# debug banners framing counsellor and user events, built once
+SIGNIN_BANNER_TOP = f'\n{Colors.GREEN}{"+" * 74}{Colors.WHITE}'
+SIGNIN_BANNER_BOTTOM = f'{Colors.GREEN}{"+" * 74}{Colors.WHITE}\n'
+SIGNOUT_BANNER_TOP = f'\n{Colors.RED}{"-" * 74}{Colors.WHITE}'
+SIGNOUT_BANNER_BOTTOM = f'{Colors.RED}{"-" * 74}{Colors.WHITE}\n'
+HGREEN_BANNER_TOP = f'\n{Colors.HGREEN}{"*" * 74}{Colors.HEND}'
+HGREEN_BANNER_BOTTOM = f'{Colors.HGREEN}{"*" * 74}{Colors.HEND}\n'
+HRED_BANNER_TOP = f'\n{Colors.HRED}{"*" * 74}{Colors.HEND}'
+HRED_BANNER_BOTTOM = f'{Colors.HRED}{"*" * 74}{Colors.HEND}\n'
+HBLUE_BANNER_TOP = f'\n{Colors.HBLUE}{"*" * 74}{Colors.HEND}'
+HBLUE_BANNER_BOTTOM = f'{Colors.HBLUE}{"*" * 74}{Colors.HEND}\n'
+
 #-------------------------------------------------------------------------------
 
 class DutyOfficerShifts(enum.Enum):
@@ -162,11 +164,7 @@ class DutyOfficerShifts(enum.Enum):
         self.end = end
         self.offset = offset
         self.num_workers = NUM_DUTY_OFFICERS.get(shift_name)
-
-
-    @property
-    def duration(self):
-        return int(self.end - self.start)  
+        self.duration = int(end - start)
 
 #-------------------------------------------------------------------------------
 
@@ -189,10 +187,7 @@ class SocialWorkerShifts(enum.Enum):
         self.end = end
         self.offset = offset
         self.num_workers = NUM_SOCIAL_WORKERS.get(shift_name)
-
-    @property
-    def duration(self):
-        return int(self.end - self.start)  
+        self.duration = int(end - start)
     
 #-------------------------------------------------------------------------------
 
@@ -215,10 +210,22 @@ class VolunteerShifts(enum.Enum):
         self.end = end
         self.offset = offset
         self.num_workers = NUM_VOLUNTEERS.get(shift_name)
+        self.duration = int(end - start)
 
-    @property
-    def duration(self):
-        return int(self.end - self.start)
+#-------------------------------------------------------------------------------
+
+# every shift is given an index into CURRENT_SHIFT_START and CURRENT_SHIFT_END
+# (shifts of different roles sharing a name share an index, so the shift
+# signing in last overwrites the times of the others)
+SHIFT_NAMES = ('GRAVEYARD', 'AM', 'PM', 'SPECIAL')
+SHIFTS = tuple(itertools.chain(
+    DutyOfficerShifts, SocialWorkerShifts, VolunteerShifts))
+for shift in SHIFTS:
+    shift.shift_index = SHIFT_NAMES.index(shift.shift_name)
+
+# start and end of the shifts currently signed in, None when signed out
+CURRENT_SHIFT_START = [None] * len(SHIFT_NAMES)
+CURRENT_SHIFT_END = [None] * len(SHIFT_NAMES)
 
 #-------------------------------------------------------------------------------
 
@@ -258,10 +265,30 @@ class AdHocDuty(enum.Enum):
         self.period_name = period_name
         self.start = start
         self.end = end
+        self.duration = end - start
 
-    @property
-    def duration(self):
-        return self.end - self.start
+#-------------------------------------------------------------------------------
+
+class Roles(enum.Enum):
+    '''
+        Counsellor Roles
+
+        # TODO: add repeated/non-repeated user mean chat duration
+    '''
+
+    SOCIAL_WORKER = ('SOCIAL_WORKER',   True,   True, False)
+    DUTY_OFFICER =  ('DUTY_OFFICER',    True,   True, False)
+    VOLUNTEER =     ('VOLUNTEER',       False,  True, False)
+
+    def __init__(self, counsellor_type, meal_break, 
+        first_tea_break, last_tea_break):
+        self.counsellor_type = counsellor_type
+        self.num_processes = MAX_SIMULTANEOUS_CHATS.get(counsellor_type)
+        self.mean_chat_duration = MEAN_CHAT_DURATION_COUNSELLOR.get(
+            counsellor_type)
+        self.meal_break = meal_break
+        self.first_tea_break = first_tea_break
+        self.last_tea_break = last_tea_break
 
 #-------------------------------------------------------------------------------
 
@@ -287,6 +314,17 @@ class Risklevels(enum.Enum):
         self.p_repeated_user = repeated_user_data[0]
         self.mean_chat_duration_repeated_user  = repeated_user_data[1]
         self.variance_chat_duration_repeated_user = repeated_user_data[2]
+
+        # counsellor roles eligible to take up the case
+        # during the graveyard shift social workers also take high risk cases
+        if risk in ('HIGH', 'CRISIS'):
+            self.eligible_roles = frozenset([Roles.DUTY_OFFICER])
+            self.eligible_roles_graveyard = frozenset(
+                [Roles.DUTY_OFFICER, Roles.SOCIAL_WORKER])
+        else:
+            self.eligible_roles = frozenset(
+                [Roles.SOCIAL_WORKER, Roles.VOLUNTEER])
+            self.eligible_roles_graveyard = self.eligible_roles
         
 #-------------------------------------------------------------------------------
 
@@ -322,28 +360,103 @@ class TOS(enum.Enum):
         self.status = status
         self.probability = probability
 
-#-------------------------------------------------------------------------------
+################################################################################
+# File IO
+################################################################################
 
-class Roles(enum.Enum):
+@functools.lru_cache(maxsize=None)
+def read_interarrivals_file(filename):
     '''
-        Counsellor Roles
+        reads in an interarrivals file, one interarrival time per line
 
-        # TODO: add repeated/non-repeated user mean chat duration
+        param:
+            filename - path to the interarrivals file
+
+        returns - tuple of interarrival times
     '''
 
-    SOCIAL_WORKER = ('SOCIAL_WORKER',   True,   True, False)
-    DUTY_OFFICER =  ('DUTY_OFFICER',    True,   True, False)
-    VOLUNTEER =     ('VOLUNTEER',       False,  True, False)
+    # parsed in C by numpy, then kept as python floats for scalar access
+    return tuple(np.loadtxt(filename, dtype=np.float64, ndmin=1).tolist() )
 
-    def __init__(self, counsellor_type, meal_break, 
-        first_tea_break, last_tea_break):
-        self.counsellor_type = counsellor_type
-        self.num_processes = MAX_SIMULTANEOUS_CHATS.get(counsellor_type)
-        self.mean_chat_duration = MEAN_CHAT_DURATION_COUNSELLOR.get(
-            counsellor_type)
-        self.meal_break = meal_break
-        self.first_tea_break = first_tea_break
-        self.last_tea_break = last_tea_break
+################################################################################
+# Forecasts
+################################################################################
+
+@functools.lru_cache(maxsize=None)
+def forecast_arrival_rates(ts, boxcox_lambda):
+    '''
+        forecasts the arrival rates up to MAX_TS_INDEX, back transformed
+        if a boxcox lambda is given
+
+        the forecast is cached, so runs sharing a fitted time series
+        (e.g. the replications in run_many) only compute it once
+
+        param:
+            ts - fitted time series model (a statsmodel object)
+            boxcox_lambda - the fitted lambda variable, or None
+
+        returns - read-only float64 array indexed by the time series index
+    '''
+    from scipy.special import inv_boxcox
+
+    arrival_rates = np.asarray(ts.predict(
+        start=0, end=MAX_TS_INDEX+OFFSET), dtype=np.float64)
+    if boxcox_lambda is not None:
+        arrival_rates = inv_boxcox(arrival_rates, boxcox_lambda)
+    arrival_rates.setflags(write=False)
+    return arrival_rates
+
+################################################################################
+# Distributions
+################################################################################
+
+def gamma_parameters(mean, variance):
+    '''
+        converts the mean and variance of a gamma distribution
+        into its shape parameter alpha (k) and scale parameter beta (theta)
+
+        param:  mean - distribution mean
+                variance - distribution variance
+
+        returns - (alpha, beta) tuple
+    '''
+    return mean ** 2 / variance, variance / mean
+
+################################################################################
+# Filters
+################################################################################
+
+def renege_certain(shifts, current_time, renege_time):
+    '''
+        checks whether a user is bound to renege because no counsellor from
+        the given shifts can take up a case before the user runs out
+        of patience
+
+        counsellors stop taking up cases LAST_CASE_CUTOFF minutes before
+        the end of their shift (see counsellors_idle), as recorded in the
+        CURRENT_SHIFT_END entry the shift shares with others of its name
+
+        param:
+            shifts - shifts with counsellors eligible to take up the case
+            current_time - current simulation time
+            renege_time - user patience
+    '''
+
+    for shift in shifts:
+        shift_end = CURRENT_SHIFT_END[shift.shift_index]
+        if shift_end is not None and shift_end - current_time > LAST_CASE_CUTOFF:
+            return False # shift is taking up cases right now
+
+    # every shift repeats daily, starting at shift.start
+    day_start = current_time - current_time % MINUTES_PER_DAY
+    for shift in shifts:
+        next_start = day_start + shift.start % MINUTES_PER_DAY
+        if next_start < current_time:
+            next_start += MINUTES_PER_DAY
+        if next_start - current_time <= renege_time:
+            return False
+
+    return True
 
 ################################################################################
 # Classes
@@ -357,6 +470,8 @@ class Counsellor:
         and an adhoc duty shift (if available)
     '''
 
+    __slots__ = ('env', 'counsellor_id', 'shift', 'role')
+
     def __init__(self, env, counsellor_id, shift, role):
         '''
             param:
@@ -383,11 +498,25 @@ class ServiceOperation:
         process
     '''
 
-    def __init__(self, *, env, ts, ts_period, thinning_random,
+    # options and probabilities for the discrete distribution getters,
+    # tabulated once per class instead of on every draw or instance
+    p_TOS_accepted = TOS.TOS_ACCEPTED.probability / sum(
+        x.probability for x in TOS)
+    TOS_options = (TOS.TOS_REJECTED, TOS.TOS_ACCEPTED) # indexed by acceptance
+
+    # joint distribution of (user status, risklevel) pairs, so both can
+    # be drawn with a single batched sample per user (see assign_user_profile)
+    user_profile_options = tuple(itertools.product(Users, Risklevels))
+    # (risklevel probabilities are normalized per user status)
+    user_profile_cdf = np.cumsum([u.probability * x.value[u.index][0]
+        / sum(y.value[u.index][0] for y in Risklevels)
+        for u, x in user_profile_options])
+
+    def __init__(self, *, env, ts, ts_period,
         boxcox_lambda=None, 
         postchat_fillout_time=POSTCHAT_FILLOUT_TIME,
         valid_chat_threshold=VALIDATE_CHAT_THRESHOLD,
-        use_actual_interarrivals=False):
+        use_actual_interarrivals=False, seed=SEED):
 
         '''
             init function
@@ -406,25 +535,51 @@ class ServiceOperation:
                     if not specified, defaults to POSTCHAT_FILLOUT_TIME
 
                 valid_chat_threshold - how much time elapsed before case is counted as valid chat
+
+                seed - seed for the numpy generator used by the batched samplers
+                    if not specified, defaults to SEED
         '''
 
+        self.interarrivals = None
         if use_actual_interarrivals:
             self.interarrivals = self.read_interarrival_time()
 
         self.time_series = ts
         self.time_series_period = ts_period
         self.boxcox_lambda = boxcox_lambda
-        self.thinning_random = thinning_random
+
+        # forecast the arrival rates once as a flat float64 array
+        # indexed by the time series index (see assign_interarrival_time)
+        # instead of calling predict on every arrival
+        self.arrival_rates = None
+        if ts is not None:
+            self.arrival_rates = forecast_arrival_rates(ts, boxcox_lambda)
 
         self.valid_chat_threshold = valid_chat_threshold
 
+        # continuous distributions are sampled in batches from a seeded
+        # numpy generator - samples are popped off per parameter set
+        self.rng = np.random.default_rng(seed)
+        self.gamma_samples = {}
+        self.user_profile_samples = []
+        self.TOS_samples = []
+
+        # arrival times of the current arrival interval (thinning only)
+        self.arrival_interval = 0
+        self.arrival_times = []
+
+        # (weekday, hour) of the current simulation hour, only recomputed
+        # once the hour has passed (see handle_user)
+        self.weekday_hour = (0, 0)
+        self.weekday_hour_end = 0
+
         self.env = env
 
         self.__counsellor_postchat_survey = postchat_fillout_time
 
 
 
-        # counters and flags (also see properties section)
+        # counters and flags
         self.num_users = 0 # to be changed in create_users()
         self.num_users_TOS_accepted = 0
         self.num_users_TOS_rejected = 0
@@ -432,18 +587,24 @@ class ServiceOperation:
 
         self.reneged = 0
         self.served = 0
-        self.served_g_repeated = 0
-        self.served_g_regular = 0
+        # users served per user status, indexed by Users.index
+        # (the Users indices start from 1)
+        self.served_by_status = [0] * (len(Users) + 1)
         self.served_g_valid = 0
  
-        self.user_in_system = []
-        self.user_queue = []
-        self.queue_status = []
-        self.queue_time_stats = []
-        self.renege_time_stats = []
-        self.case_chat_time = []
+        self.user_in_system = {} # insertion ordered, O(1) removal
+        self.user_queue = {} # insertion ordered, O(1) removal
+        self.__queue_status = RecordLog(QUEUE_STATUS_DTYPE)
+        self.__queue_time_stats = RecordLog(QUEUE_TIME_STAT_DTYPE)
+        self.__renege_time_stats = RecordLog(QUEUE_TIME_STAT_DTYPE)
 
-        self.num_available_counsellor_processes = []
+        # running mean and sum of squared deviations of the chat times
+        # of served users (Welford), in place of a list of all chat times
+        self.__case_chat_time_mean = 0.
+        self.__case_chat_time_m2 = 0.
+
+        # number of available counsellor processes over time
+        self.__num_available = RecordLog(NUM_AVAILABLE_DTYPE)
 
         self.user_queue_max_length = 0
 
@@ -453,7 +614,16 @@ class ServiceOperation:
 
         # service operation is given an infinite counsellor intake capacity
         # to accomodate four counsellor shifts (see enum Shifts for details)
-        self.store_counsellors_active = simpy.FilterStore(env)
+        # idle counsellors are kept in one store per (role, shift)
+        # counsellors finishing a chat after the case cutoff are put into
+        # the signout store of their shift instead, so the store a
+        # counsellor returns to is looked up in stores_counsellors_return
+        self.stores_counsellors_active = {}
+        self.stores_counsellors_signout = {}
+        self.stores_counsellors_return = {}
+        # requests of a shift signing out for its counsellors still in
+        # a chat, as (store request, event the shift waits on) pairs
+        self.signout_requests = {}
 
         # create counsellors at different shifts
         self.counsellors = {}
@@ -467,6 +637,46 @@ class ServiceOperation:
             self.counsellors[s] = []
             self.create_counsellors(s, Roles.VOLUNTEER)
 
+        # stores a user of each risklevel may take a counsellor from,
+        # tried in the order they were created
+        self.stores_by_risklevel = {risk: [
+            store for (role, shift), store in self.stores_counsellors_active.items()
+            if role in (risk.eligible_roles_graveyard
+                if shift.shift_name == 'GRAVEYARD' else risk.eligible_roles)
+        ] for risk in Risklevels}
+
+        # shifts whose times decide whether a user of each risklevel may be
+        # served - the staffed shifts behind the stores, along with every
+        # shift sharing their index into CURRENT_SHIFT_END
+        shifts_by_risklevel = {}
+        for risk in Risklevels:
+            shift_indices = {
+                shift.shift_index
+                for (role, shift), store in self.stores_counsellors_active.items()
+                if store in self.stores_by_risklevel[risk] and shift.num_workers}
+            shifts_by_risklevel[risk] = frozenset(
+                shift for shift in SHIFTS if shift.shift_index in shift_indices)
+
+        # everything handle_user needs to know about a user, resolved once
+        # per user status and risklevel - the gamma parameters of patience
+        # and chat duration, the stores to take a counsellor from
+        # and the shifts behind them
+        self.user_profiles = {}
+        for u in Users:
+            for risk in Risklevels:
+                if u is Users.REPEATED:
+                    chat_duration_params = gamma_parameters(
+                        risk.mean_chat_duration_repeated_user,
+                        risk.variance_chat_duration_repeated_user)
+                else:
+                    chat_duration_params = gamma_parameters(
+                        risk.mean_chat_duration_non_repeated_user,
+                        risk.variance_chat_duration_non_repeated_user)
+                self.user_profiles[u, risk] = (
+                    gamma_parameters(u.mean_patience, u.variance_patience),
+                    chat_duration_params, self.stores_by_risklevel[risk],
+                    shifts_by_risklevel[risk])
+
         # logging.debug(f'Counsellors Arranged:\n{self.counsellors}')
 
         # set up idle processes
@@ -479,6 +689,14 @@ class ServiceOperation:
 
 
 
+        # pooled user workers - accepted users are put into the inbox and
+        # picked up by an idle worker; the pool grows whenever all workers
+        # are busy, so no user is held back waiting for a worker
+        self.user_inbox = simpy.Store(env)
+        self.__num_idle_user_workers = NUM_USER_WORKERS
+        for _ in range(NUM_USER_WORKERS):
+            self.env.process(self.user_worker() )
+
         # generate users
         # this process will not be disrupted even when counsellors sign out
         self.user_procs = self.env.process(self.create_users() )
@@ -490,69 +708,36 @@ class ServiceOperation:
     ############################################################################
 
     @property
-    def user_queue_max_length(self):
-        return self.__user_queue_max_length
-
-    @property
-    def num_users(self):
-        return self.__num_users
-
-    @property
-    def reneged(self):
-        return self.__reneged
+    def num_available_counsellor_processes(self):
+        # (time, number of available counsellor processes) tuples
+        return self.__num_available.view().tolist()
 
     @property
-    def served(self):
-        return self.__served
+    def queue_status(self):
+        # structured array of (weekday, hour, queue_length) records
+        return self.__queue_status.view()
 
     @property
-    def served_g_repeated(self):
-        return self.__served_g_repeated
+    def queue_time_stats(self):
+        # structured array of (weekday, hour, time_spent_in_queue) records
+        return self.__queue_time_stats.view()
 
     @property
-    def served_g_regular(self):
-        return self.__served_g_regular
+    def renege_time_stats(self):
+        # structured array of (weekday, hour, time_spent_in_queue) records
+        return self.__renege_time_stats.view()
 
     @property
-    def served_g_valid(self):
-        return self.__served_g_valid
+    def case_chat_time_mean(self):
+        # mean chat time of the users served so far
+        return self.__case_chat_time_mean
 
     @property
-    def case_chat_time(self):
-        return self.__case_chat_time
-
-    @user_queue_max_length.setter
-    def user_queue_max_length(self, value):
-        self.__user_queue_max_length = value
-
-    @num_users.setter
-    def num_users(self, value):
-        self.__num_users = value
-
-    @reneged.setter
-    def reneged(self, value):
-        self.__reneged = value
-
-
-    @served.setter
-    def served(self, value):
-        self.__served = value
-
-    @served_g_repeated.setter
-    def served_g_repeated(self, value):
-        self.__served_g_repeated = value
-
-    @served_g_regular.setter
-    def served_g_regular(self, value):
-        self.__served_g_regular = value
-
-    @served_g_valid.setter
-    def served_g_valid(self, value):
-        self.__served_g_valid = value  
-
-    @case_chat_time.setter
-    def case_chat_time(self, value):
-        self.__case_chat_time = value
+    def case_chat_time_variance(self):
+        # sample variance of the chat time of the users served so far
+        if self.served < 2:
+            return 0.
+        return self.__case_chat_time_m2 / (self.served - 1)
 
     ############################################################################
     # counsellor related functions
@@ -569,6 +754,11 @@ class ServiceOperation:
             precondition - shift must match with role
         '''            
 
+        self.stores_counsellors_active[role, shift] = simpy.Store(self.env)
+        self.stores_counsellors_signout[role, shift] = simpy.Store(self.env)
+        self.stores_counsellors_return[role, shift] = (
+            self.stores_counsellors_active[role, shift])
+
         # signing in involves creating multiple counsellor processes
         for id_ in range(1, shift.num_workers+1):
             for subprocess_num in range(1, role.num_processes+1):
@@ -581,6 +771,70 @@ class ServiceOperation:
 
     #---------------------------------------------------------------------------
 
+    def close_counsellor_store(self, role, shift):
+        '''
+            stops the counsellors of a shift from taking up new cases - idle
+            counsellors are moved to the signout store, and counsellors
+            finishing a chat from now on return there as well
+
+            param:
+            role - role of the shift, a role enum
+            shift - one of Shifts enum
+        '''
+
+        store = self.stores_counsellors_active[role, shift]
+        signout_store = self.stores_counsellors_signout[role, shift]
+        self.stores_counsellors_return[role, shift] = signout_store
+        for counsellor in store.items:
+            signout_store.put(counsellor)
+        store.items.clear()
+
+        # a shift signing out while its store was still open waits on
+        # that store - move the requests still pending to the signout store
+        requests = self.signout_requests.get((role, shift), ())
+        for i, (request, signed_out) in enumerate(requests):
+            if not request.triggered:
+                request.cancel()
+                requests[i] = self.request_signout(signout_store, signed_out)
+
+    #---------------------------------------------------------------------------
+
+    def request_signout(self, store, signed_out=None):
+        '''
+            requests a counsellor signing out from store
+
+            param:
+            store - store the counsellor returns to
+            signed_out - event to trigger with the counsellor,
+                a new one if None
+
+            returns - (store request, signed_out) pair
+        '''
+
+        if signed_out is None:
+            signed_out = self.env.event()
+        request = store.get()
+        request.callbacks.append(
+            lambda request: signed_out.succeed(request.value) )
+        return request, signed_out
+
+    #---------------------------------------------------------------------------
+
+    def close_counsellor_stores(self, shift_index):
+        '''
+            closes the stores of every shift sharing an index into
+            CURRENT_SHIFT_START and CURRENT_SHIFT_END
+
+            param:
+            shift_index - index of the shifts
+        '''
+
+        for role, shift in self.stores_counsellors_active:
+            if shift.shift_index == shift_index:
+                self.close_counsellor_store(role, shift)
+
+    #---------------------------------------------------------------------------
+
     def counsellors_idle(self, shift, role):
         '''
             routine to sign in counsellors during a shift
@@ -592,6 +846,8 @@ class ServiceOperation:
             precondition: role must match with shift
         '''
 
+        store = self.stores_counsellors_active[role, shift]
+        signout_store = self.stores_counsellors_signout[role, shift]
         total_procs = shift.num_workers * role.num_processes
         counsellor_init = True # init flag
         counsellor_init_2 = True # init flag # 2
@@ -625,49 +881,67 @@ class ServiceOperation:
 
 
                 if shift_remaining == shift.duration or shift_remaining == shift.end%MINUTES_PER_DAY:
-                    CURRENT_SHIFT_START[shift.shift_name] = start_shift_time
-                    CURRENT_SHIFT_END[shift.shift_name] = scheduled_end_shift_time
+                    CURRENT_SHIFT_START[shift.shift_index] = start_shift_time
+                    CURRENT_SHIFT_END[shift.shift_index] = scheduled_end_shift_time
+                    self.stores_counsellors_return[role, shift] = store
 
                         # begin shift by putting counsellors in the store
                     for counsellor in self.counsellors[shift]:
-                        logging.debug(f'\n{Colors.GREEN}++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++{Colors.WHITE}')
-                        logging.debug(f'{Colors.GREEN}Counsellor {counsellor.counsellor_id} signed in at t = {start_shift_time:.3f}{Colors.WHITE}')
-                        logging.debug(f'{Colors.GREEN}++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++{Colors.WHITE}\n')
+                        if DEBUG:
+                            logging.debug(SIGNIN_BANNER_TOP)
+                            logging.debug(f'{Colors.GREEN}Counsellor {counsellor.counsellor_id} signed in at t = {start_shift_time:.3f}{Colors.WHITE}')
+                            logging.debug(SIGNIN_BANNER_BOTTOM)
                         # assert start_shift_time % MINUTES_PER_DAY == shift.start or start_shift_time == 0
-                        assert counsellor not in self.store_counsellors_active.items
-                        yield self.store_counsellors_active.put(counsellor)
+                        assert counsellor not in store.items
+                        yield store.put(counsellor)
 
                     # logging.debug(f'Signed in shift:{shift.shift_name} at {start_shift_time}.'
-                    #     f'  There are {len(self.store_counsellors_active.items)} idle SO counsellor processes:')
+                    #     f'  There are {len(store.items)} idle SO counsellor processes:')
                     # self.print_idle_counsellors_working()
 
-                yield self.env.timeout(shift_remaining) # delay for shift.start minutes
-                    
-
-
-                # allow only counsellors at a role and a shift to sign out
-                counsellor_procs = [self.store_counsellors_active.get(
-                    lambda x: x.shift is shift and x.role is role)
-                    for _ in range(total_procs)]
-
-                # wait for all procs
-                counsellor = yield AllOf(self.env, counsellor_procs)
-
-                # get all nested counsellor instances
-                counsellor_instances = [counsellor[list(counsellor)[i]] for i in range(total_procs)]
+                # stop taking up cases LAST_CASE_CUTOFF minutes before the
+                # end of the shift, as recorded in CURRENT_SHIFT_END - this
+                # closes every shift sharing the entry, and leaves them
+                # all open if another shift has moved the end further out
+                case_cutoff_time = max(shift_remaining - LAST_CASE_CUTOFF, 0)
+                yield self.env.timeout(case_cutoff_time)
+                shift_end = CURRENT_SHIFT_END[shift.shift_index]
+                if shift_end is None or shift_end - self.env.now <= LAST_CASE_CUTOFF:
+                    self.close_counsellor_stores(shift.shift_index)
+
+                yield self.env.timeout(shift_remaining - case_cutoff_time)
+
+                # wait for counsellors still in a chat to finish - they
+                # return to the store as long as CURRENT_SHIFT_END keeps it
+                # open, where users already waiting are served first
+                return_store = self.stores_counsellors_return[role, shift]
+                counsellor_instances = return_store.items[:]
+                return_store.items.clear()
+                num_busy_procs = total_procs - len(counsellor_instances)
+                if num_busy_procs:
+                    requests = [self.request_signout(return_store)
+                        for _ in range(num_busy_procs)]
+                    self.signout_requests[role, shift] = requests
+                    counsellor = yield AllOf(self.env,
+                        [signed_out for _, signed_out in requests])
+                    del self.signout_requests[role, shift]
+                    counsellor_instances.extend(counsellor.values())
 
                 actual_end_shift_time = self.env.now
-                CURRENT_SHIFT_START[shift.shift_name] = None
-                CURRENT_SHIFT_END[shift.shift_name] = None
+                CURRENT_SHIFT_START[shift.shift_index] = None
+                CURRENT_SHIFT_END[shift.shift_index] = None
+                self.close_counsellor_stores(shift.shift_index)
                 for c in counsellor_instances:
-                    logging.debug(f'\n{Colors.RED}--------------------------------------------------------------------------{Colors.WHITE}')
-                    logging.debug(f'{Colors.RED}Counsellor {c.counsellor_id} signed out at t = {actual_end_shift_time:.3f}.  Overtime: {(actual_end_shift_time-scheduled_end_shift_time):.3f} minutes{Colors.WHITE}')
-                    logging.debug(f'{Colors.RED}--------------------------------------------------------------------------{Colors.WHITE}\n')
+                    if DEBUG:
+                        logging.debug(SIGNOUT_BANNER_TOP)
+                        logging.debug(f'{Colors.RED}Counsellor {c.counsellor_id} signed out at t = {actual_end_shift_time:.3f}.  Overtime: {(actual_end_shift_time-scheduled_end_shift_time):.3f} minutes{Colors.WHITE}')
+                        logging.debug(SIGNOUT_BANNER_BOTTOM)
                     # assert time_now % MINUTES_PER_DAY == shift.start or time_now == 0
-                    assert counsellor not in self.store_counsellors_active.items
+                    assert c not in store.items
 
-                logging.debug(f'Signed out shift:{shift.shift_name} at {self.env.now}.'
-                    f'  There are {len(self.store_counsellors_active.items)} idle SO counsellor processes:')
+                if DEBUG:
+                    logging.debug(f'Signed out shift:{shift.shift_name} at {self.env.now}.'
+                        f'  There are {self.num_idle_counsellor_processes()} idle counsellor processes:')
                 # self.print_idle_counsellors_working()
 
                 shift_remaining = 0 # exit loop
@@ -678,8 +952,9 @@ class ServiceOperation:
             max_end_shift_time = max(actual_end_break_time, actual_end_shift_time)
             overtime = max_end_shift_time - scheduled_end_shift_time
             next_offset = shift.offset - overtime
-            logging.debug(f'Overtime: {overtime}, actual end shift {max_end_shift_time}, scheduled end shift {scheduled_end_shift_time} ')
-            logging.debug(f'Next shift offset: {next_offset}, actual: {shift.offset}')
+            if DEBUG:
+                logging.debug(f'Overtime: {overtime}, actual end shift {max_end_shift_time}, scheduled end shift {scheduled_end_shift_time} ')
+                logging.debug(f'Next shift offset: {next_offset}, actual: {shift.offset}')
             
             # wait offset minutes - overtime for next shift
             # this fixes the edge case when counsellor goes overtime and
@@ -696,30 +971,43 @@ class ServiceOperation:
             at "interarrival_time" invervals to mimic user interarrivals
         '''
 
-        for i in itertools.count(): # use this instead of while loop 
-                                     # for efficient looping
-
+        tos_accepted = TOS.TOS_ACCEPTED
+        for uid in itertools.count(1):
             # space out incoming users
-            interarrival_time = self.assign_interarrival_time(i)
-            if interarrival_time is None:
-                continue # skip the rest of the code and move to next iteration
+            # (uid - 1 doubles as the index into the actual interarrivals)
+            yield self.env.timeout(self.assign_interarrival_time(uid - 1) )
 
-            yield self.env.timeout(interarrival_time)
-
-            self.num_users += 1 # increment counter
-            uid = self.num_users + 1
+            self.num_users = uid # update counter
 
             # if TOS accepted, send add user to the queue
             # otherwise increment counter and do nothing
-            tos_state = self.assign_TOS_acceptance()
-            if tos_state == TOS.TOS_ACCEPTED:
+            if self.assign_TOS_acceptance() is tos_accepted:
                 self.num_users_TOS_accepted += 1
-                self.env.process(self.handle_user(uid) )
+
+                # hand the user to an idle worker, or grow the pool
+                if self.__num_idle_user_workers:
+                    self.__num_idle_user_workers -= 1
+                else:
+                    self.env.process(self.user_worker() )
+                self.user_inbox.put(uid)
             else: # if TOS.TOS_REJECTED
                 self.num_users_TOS_rejected += 1
 
     #---------------------------------------------------------------------------
 
+    def user_worker(self):
+        '''
+            pooled user process - takes users off the user inbox and runs
+            each one through handle_user in turn
+        '''
+
+        while True:
+            user_id = yield self.user_inbox.get()
+            yield from self.handle_user(user_id)
+            self.__num_idle_user_workers += 1
+
+    #---------------------------------------------------------------------------
+
     def handle_user(self, user_id):
 
         '''
@@ -732,202 +1020,172 @@ class ServiceOperation:
                 user_id - user id
         '''
 
-        # lambda filters
-        def case_cutoff(x):
-            '''
-                lambda filter for case cutoff (limiting overtime)
-                Conditionals make sure edge cases 
-                (Special and Graveyard) are being dealt with
-            '''
-            current_time = self.env.now
-
-            shift_end = CURRENT_SHIFT_END.get(x.shift.shift_name)
-            if shift_end is not None:
-                diff = shift_end - current_time
-            else:
-                diff = -current_time
-            return diff > LAST_CASE_CUTOFF
-
-
-        def get_counsellor(x, risk):
-            '''
-                lambda filter for get_counsellor
-            '''
-            if risk in [Risklevels.HIGH, Risklevels.CRISIS]:
-                if x.shift.shift_name == 'GRAVEYARD':
-                     return x.role in [Roles.DUTY_OFFICER, Roles.SOCIAL_WORKER]
-                # otherwise
-                return x.role is Roles.DUTY_OFFICER
-            # else:
-            return x.role in [Roles.SOCIAL_WORKER, Roles.VOLUNTEER]
-
-
-        user_status = self.assign_user_status()
-        risklevel = self.assign_risklevel(user_status)
-        renege_time = self.assign_renege_time(
-            user_status.mean_patience, user_status.variance_patience)
-
-        if user_status is Users.REPEATED:
-            chat_duration = self.assign_chat_duration(
-                risklevel.mean_chat_duration_repeated_user,
-                risklevel.variance_chat_duration_repeated_user
-            )
-        else:
-            chat_duration = self.assign_chat_duration(
-                risklevel.mean_chat_duration_non_repeated_user,
-                risklevel.variance_chat_duration_non_repeated_user
-            )
+        env = self.env
+        user_status, risklevel = self.assign_user_profile()
+        (patience_params, chat_duration_params, stores,
+            shifts) = self.user_profiles[user_status, risklevel]
 
-        process_user = chat_duration + self.__counsellor_postchat_survey # total time to process user
-        init_flag = True
+        renege_time = self.assign_renege_time(*patience_params)
+        chat_duration = self.assign_chat_duration(*chat_duration_params)
 
+        process_user = chat_duration + self.__counsellor_postchat_survey # total time to process user
 
-        while process_user:
-            start_time = self.env.now
 
-            if init_flag:
-                logging.debug(f'\n{Colors.HGREEN}**************************************************************************{Colors.HEND}')
-                logging.debug(f'{Colors.HGREEN}User -- {user_id} has just accepted TOS.  Chat session created at '
-                        f'{start_time:.3f}{Colors.HEND}')
-                logging.debug(f'{Colors.HGREEN}**************************************************************************{Colors.HEND}\n')
+        start_time = env.now
 
-                self.user_in_system.append(user_id)
-                self.user_queue.append(user_id)
+        if DEBUG:
+            logging.debug(HGREEN_BANNER_TOP)
+            logging.debug(f'{Colors.HGREEN}User -- {user_id} has just accepted TOS.  Chat session created at '
+                    f'{start_time:.3f}{Colors.HEND}')
+            logging.debug(HGREEN_BANNER_BOTTOM)
 
+        self.user_in_system[user_id] = None
+        user_queue = self.user_queue
+        user_queue[user_id] = None
 
-            # wait for a counsellor matching role or renege
-            # get only counsellors matching risklevel to role
-            # and remaining shift > LAST_CASE_CUTOFF
-            counsellor = self.store_counsellors_active.get(
-                lambda x: case_cutoff(x) and get_counsellor(x, risklevel)
-            )
-
-            results = yield counsellor | self.env.timeout(renege_time)
-
-            # record the time spent in the queue
-            current_time = self.env.now
-            time_spent_in_queue = current_time - start_time
-            current_day_minutes = int(current_time) % MINUTES_PER_DAY
-            weekday = int(current_time / MINUTES_PER_DAY) % DAYS_IN_WEEK
-            hour = int(current_day_minutes / MINUTES_PER_HOUR)
-            if counsellor in results:    
-                self.queue_time_stats.append({
-                    'weekday': weekday,
-                    'hour': hour,
-                    'time_spent_in_queue': time_spent_in_queue,
-                })
+        # wait for a counsellor matching role or renege
+        # get only counsellors from stores matching risklevel to role
+        # (stores hold no counsellors past the case cutoff of their shift)
+        # stop requesting as soon as one store hands over a counsellor
+        # if no counsellor can take up the case before the user reneges,
+        # skip the requests and only wait out the renege time
+        counsellor_procs = []
+        if renege_certain(shifts, start_time, renege_time):
+            yield env.timeout(renege_time)
+        else:
+            for store in stores:
+                counsellor_procs.append(store.get() )
+                if counsellor_procs[-1].triggered:
+                    break
+
+            yield AnyOf(env,
+                counsellor_procs + [env.timeout(renege_time)])
+
+        # keep the first counsellor handed over, return any others
+        # and withdraw the requests still pending
+        # (others go wherever a counsellor finishing a chat would, so
+        # none ends up in a store already closed at the case cutoff)
+        counsellor_instance = None
+        for counsellor in counsellor_procs:
+            if not counsellor.triggered:
+                counsellor.cancel()
+            elif counsellor_instance is None:
+                counsellor_instance = counsellor.value
             else:
-                self.renege_time_stats.append({
-                    'weekday': weekday,
-                    'hour': hour,
-                    'time_spent_in_queue': renege_time,
-                })
+                c = counsellor.value
+                self.stores_counsellors_return[c.role, c.shift].put(c)
+
+        # record the time spent in the queue
+        # weekday and hour only change on the hour, so they are cached
+        # and recomputed once the current hour has passed
+        current_time = env.now
+        time_spent_in_queue = current_time - start_time
+        if current_time >= self.weekday_hour_end:
+            hours = int(current_time) // MINUTES_PER_HOUR
+            self.weekday_hour = (
+                hours // 24 % DAYS_IN_WEEK, hours % 24)
+            self.weekday_hour_end = (hours + 1) * MINUTES_PER_HOUR
+        weekday, hour = self.weekday_hour
+        if counsellor_instance is not None:
+            self.__queue_time_stats.append(
+                (weekday, hour, time_spent_in_queue) )
+        else:
+            self.__renege_time_stats.append(
+                (weekday, hour, renege_time) )
 
-            # dequeue user in the waiting queue
-            self.user_queue.remove(user_id) 
-            current_user_queue_length = len(self.user_queue)
+        # dequeue user in the waiting queue
+        del user_queue[user_id]
+        current_user_queue_length = len(user_queue)
 
-            # update maximum user queue length
-            if current_user_queue_length > self.user_queue_max_length:
-                self.user_queue_max_length = current_user_queue_length
+        # update maximum user queue length
+        if current_user_queue_length > self.user_queue_max_length:
+            self.user_queue_max_length = current_user_queue_length
 
+            if DEBUG:
                 logging.debug(f'Updated max queue length to '
                     f'{self.user_queue_max_length}.\n'
-                    f'User Queue: {self.user_queue}\n\n\n')
-
+                    f'User Queue: {list(user_queue)}\n\n\n')
 
-            # update queue status
-            if current_user_queue_length >= QUEUE_THRESHOLD:
-                current_time = self.env.now
-                current_day_minutes = int(current_time) % MINUTES_PER_DAY
-                weekday = int(current_time / MINUTES_PER_DAY) % DAYS_IN_WEEK
-                hour = int(current_day_minutes / MINUTES_PER_HOUR)
 
+        # update queue status
+        if current_user_queue_length >= QUEUE_THRESHOLD:
+            if DEBUG:
                 logging.debug(
                     f'Weekday: {weekday} - '
                     f'Hour: {hour}, '
                     f'Queue Length: {current_user_queue_length}'
                 )
 
-                self.queue_status.append({
-                    'weekday': weekday,
-                    'hour': hour,
-                    'queue_length': current_user_queue_length
-                })
+            self.__queue_status.append(
+                (weekday, hour, current_user_queue_length) )
 
-            logging.debug(f'Current User Queue contains: {self.user_queue}')
+        if DEBUG:
+            logging.debug(f'Current User Queue contains: {list(user_queue)}')
 
 
-            # store number of available counsellor processes at time
-            self.num_available_counsellor_processes.append(
-                (self.env.now, len(self.store_counsellors_active.items) )
-            )
-            
-
+        # store number of available counsellor processes at time
+        self.__num_available.append(
+            (current_time, self.num_idle_counsellor_processes() ) )
+        
 
-            if counsellor not in results: # if user reneged
-                # remove user from system record
-                self.user_in_system.remove(user_id)
-                logging.debug(f'User in system: {self.user_in_system}')
-                time_spent_in_queue = renege_time
 
-                logging.debug(f'\n{Colors.HRED}**************************************************************************{Colors.HEND}')
+        if counsellor_instance is None: # if user reneged
+            # remove user from system record
+            del self.user_in_system[user_id]
+            if DEBUG:
+                logging.debug(f'User in system: {list(self.user_in_system)}')
+                logging.debug(HRED_BANNER_TOP)
                 logging.debug(f'{Colors.HRED}User {user_id} reneged after '
                     f'spending t = {renege_time:.3f} minutes in the queue.{Colors.HEND}')
-                logging.debug(f'{Colors.HRED}**************************************************************************{Colors.HEND}\n')
-                self.reneged += 1 # update counter
-                counsellor.cancel() # cancel counsellor request
-                process_user = 0
-                init_flag = False
+                logging.debug(HRED_BANNER_BOTTOM)
+            self.reneged += 1 # update counter
 
 
 
-            else: # if counsellor takes in a user
-                start_time = self.env.now
-                counsellor_instance = results[list(results)[0]] # unpack the counsellor instance
+        else: # if counsellor takes in a user
+            start_time = current_time
 
-                try:
-                    logging.debug(f'\n{Colors.HGREEN}**************************************************************************{Colors.HEND}')
-                    logging.debug(f'{Colors.HGREEN}User {user_id} is assigned to '
-                        f'{counsellor_instance.counsellor_id} at {self.env.now:.3f}{Colors.HEND}')
-                    logging.debug(f'{Colors.HGREEN}**************************************************************************{Colors.HEND}\n')
+            if DEBUG:
+                logging.debug(HGREEN_BANNER_TOP)
+                logging.debug(f'{Colors.HGREEN}User {user_id} is assigned to '
+                    f'{counsellor_instance.counsellor_id} at {start_time:.3f}{Colors.HEND}')
+                logging.debug(HGREEN_BANNER_BOTTOM)
 
-                    # timeout is chat duration + self.__counsellor_postchat_survey_time
-                    # minutes to fill out postchat survey
-                    yield self.env.timeout(process_user)
+            # timeout is chat duration + self.__counsellor_postchat_survey_time
+            # minutes to fill out postchat survey
+            yield env.timeout(process_user)
 
-                    # put the counsellor back into the store, so it will be available
-                    # to the next user
-                    logging.debug(f'\n{Colors.HBLUE}**************************************************************************{Colors.HEND}')
-                    logging.debug(f'{Colors.HBLUE}User {user_id}\'s counselling session lasted t = '
-                        f'{chat_duration:.3f} minutes.\nCounsellor {counsellor_instance.counsellor_id} '
-                        f'is now available at {self.env.now:.3f}.{Colors.HEND}')
-                    logging.debug(f'{Colors.HBLUE}**************************************************************************{Colors.HEND}\n')
+            # put the counsellor back into the store, so it will be available
+            # to the next user
+            if DEBUG:
+                logging.debug(HBLUE_BANNER_TOP)
+                logging.debug(f'{Colors.HBLUE}User {user_id}\'s counselling session lasted t = '
+                    f'{chat_duration:.3f} minutes.\nCounsellor {counsellor_instance.counsellor_id} '
+                    f'is now available at {env.now:.3f}.{Colors.HEND}')
+                logging.debug(HBLUE_BANNER_BOTTOM)
 
 
-                    # remove user from system record
-                    self.user_in_system.remove(user_id)
-                    # logging.debug(f'User in system: {self.user_in_system}')
+            # remove user from system record
+            del self.user_in_system[user_id]
+            # logging.debug(f'User in system: {list(self.user_in_system)}')
 
-                    # counsellor resource is now available
-                    yield self.store_counsellors_active.put(counsellor_instance)
+            # counsellor resource is now available, unless the shift
+            # has passed its case cutoff
+            yield self.stores_counsellors_return[
+                counsellor_instance.role, counsellor_instance.shift].put(
+                counsellor_instance)
 
-                    self.served += 1 # update counter
-                    if user_status is Users.REPEATED:
-                        self.served_g_repeated += 1
-                    else:
-                        self.served_g_regular += 1
+            self.served += 1 # update counters
+            self.served_by_status[user_status.index] += 1
 
-                    case_chat_time = process_user - self.__counsellor_postchat_survey
-                    self.case_chat_time.append(case_chat_time)
-                    if case_chat_time >= self.valid_chat_threshold:
-                        self.served_g_valid += 1
-                    process_user = 0
+            delta = chat_duration - self.__case_chat_time_mean
+            self.__case_chat_time_mean += delta / self.served
+            self.__case_chat_time_m2 += delta * (
+                chat_duration - self.__case_chat_time_mean)
+            if chat_duration >= self.valid_chat_threshold:
+                self.served_g_valid += 1
 
 
-                except simpy.Interrupt as si:
-                    process_user -= self.env.now - start_time
-                    init_flag = False
 
     ############################################################################
     # Predefined Distribution Getters
@@ -935,188 +1193,152 @@ class ServiceOperation:
 
     def assign_interarrival_time(self, idx=None):
         '''
-            Getter to assign interarrival time using Thinning Algorithm on an
-            interval-interval basis
+            Getter to assign interarrival time, either from the actual
+            interarrivals or on an interval-interval basis from the forecast
+            arrival rates
             
             interarrival time follows the exponential distribution
 
+            param:  idx - index into the actual interarrivals (if loaded)
+
             returns - interarrival time
         '''
 
-        if idx is not None:
+        if idx is not None and self.interarrivals is not None:
             end_interarrivals = len(self.interarrivals)
             return self.interarrivals[idx%end_interarrivals]
 
+        # the arrival rate only changes at interval boundaries, so arrivals
+        # are drawn for a whole interval at a time
+        while not self.arrival_times:
+            self.draw_interval_arrivals()
+        return self.arrival_times.pop() - self.env.now
 
+    #---------------------------------------------------------------------------
 
+    def draw_interval_arrivals(self):
+        '''
+            draws the arrival times of the next arrival interval
+            from a homogeneous Poisson Process, using the dominant arrival
+            rate around the interval
 
-        def get_max_arrival_rate(start_interval, end_interval):
-            '''
-                helper function to get the arrival rate lambda at within an
-                interval range
-
-                param:  start_interval - index to start
-                        end_interval - index to end
-
-                precondition: start_interval >= end_interval
-            '''
-
-            # take the maximum arrival rate within interval
-            arrival_rate = self.time_series.predict(
-                start=start_interval+OFFSET, end=end_interval+OFFSET).max()
-            if self.boxcox_lambda is not None:
-                arrival_rate = inv_boxcox(
-                    arrival_rate, self.boxcox_lambda)
-            return arrival_rate
-
-        #-----------------------------------------------------------------------
-
-        def get_arrival_rate(interval):
-            '''
-                helper function to get the arrival rate lambda at the specific
-                interval
-
-                param:  interval - index
-            '''
-
-            return get_max_arrival_rate(interval+OFFSET, interval+OFFSET)
-
-        #-----------------------------------------------------------------------
-
+            arrival times are kept in self.arrival_times, latest first
+        '''
 
-        # cast this as integer to get a rough estimate
-        # calculate the nearest hour as an integer
-        # use it to access the mean interarrival time, from which the lambda
-        # can be calculated
-        current_time = self.env.now
-        current_time_int = int(current_time)
-        current_weekday = int(current_time_int / MINUTES_PER_DAY)
-        current_day_minutes = current_time % MINUTES_PER_DAY
-        nearest_two_hours = int(current_day_minutes / 120)
+        interval_start = self.arrival_interval * ARRIVAL_INTERVAL
+        interval_end = interval_start + ARRIVAL_INTERVAL
 
-        local_max_idx_pt = int(self.time_series_period * current_weekday + nearest_two_hours)
+        weekday, day_minutes = divmod(interval_start, MINUTES_PER_DAY)
+        local_max_idx_pt = int(self.time_series_period * weekday
+            + day_minutes // ARRIVAL_INTERVAL)
         max_idx_start = local_max_idx_pt - 1
-        max_idx_end = local_max_idx_pt + 1# self.time_series_period - 1
-        if max_idx_end > 1104:
-            max_idx_end = 1104
-
-        # generate the dominant homogeneous Poisson Process
-        max_arrival_rate = get_max_arrival_rate(max_idx_start, max_idx_end)
-        homo_interarrival_time = random.expovariate(max_arrival_rate)
-        return homo_interarrival_time
-
-
-        # find idx = x+t
-        next_arrival_time = current_time + homo_interarrival_time
-        next_weekday = int(next_arrival_time / MINUTES_PER_DAY)
-        next_arrival_time_day_minutes = next_arrival_time % MINUTES_PER_DAY
-        next_nearest_two_hour_interval = int(next_arrival_time_day_minutes / 120)
-        idx = int(self.time_series_period*next_weekday + next_nearest_two_hour_interval)
-    
-        # calculate lambda(x+t)
-        next_arrival_rate = get_arrival_rate(idx)
-
-        # logging.debug(f'Current time: {current_time}')
-        # logging.debug(f'Current weekday: {current_weekday}')
+        max_idx_end = local_max_idx_pt + 1
+        if max_idx_end > MAX_TS_INDEX:
+            max_idx_end = MAX_TS_INDEX
+
+        # take the maximum arrival rate around the interval
+        # (inv_boxcox was applied upfront - it preserves the ordering)
+        max_arrival_rate = self.arrival_rates[
+            max_idx_start+OFFSET:max_idx_end+OFFSET+1].max()
+
+        # cumulate exponential interarrival times in batches
+        # until the end of the interval is passed
+        arrival_times = []
+        arrival_time = interval_start
+        batch_size = int(max_arrival_rate * ARRIVAL_INTERVAL * 1.5) + 8
+        while arrival_time < interval_end:
+            batch = arrival_time + np.cumsum(
+                self.rng.standard_exponential(batch_size) / max_arrival_rate)
+            arrival_times.extend(batch[batch < interval_end].tolist() )
+            arrival_time = batch[-1]
+
+        self.arrival_times = arrival_times[::-1]
+        self.arrival_interval += 1
 
-        # logging.debug(f'Next time: {next_arrival_time}')
-        # logging.debug(f'Next weekday: {next_weekday}')
-        # logging.debug(f'Next Minutes day: {next_arrival_time_day_minutes}')
-        # logging.debug(f'Next Nearest two hour: {next_nearest_two_hour_interval}')
-        # logging.debug(f'index: {idx}')
+    #---------------------------------------------------------------------------
 
+    def next_gamma(self, alpha, beta):
+        '''
+            returns the next gamma distributed sample with shape alpha
+            and scale beta, refilling the batch for these parameters
+            when it runs out
+        '''
 
-        # decide whether to output interarrival time
-        random_num = self.thinning_random.uniform(0, 1)
-        if random_num <= (next_arrival_rate / max_arrival_rate):
-            return homo_interarrival_time
-        return None
+        samples = self.gamma_samples.get((alpha, beta) )
+        if not samples:
+            samples = self.rng.gamma(alpha, beta, SAMPLE_BATCH_SIZE).tolist()
+            self.gamma_samples[alpha, beta] = samples
+        return samples.pop()
 
     #---------------------------------------------------------------------------
 
-    def assign_renege_time(self, mean_patience, variance_patience):
+    def assign_renege_time(self, alpha, beta):
         '''
             Getter to assign patience to user
             user patience follows the gamma distribution
 
-            The python gamma pdf is parametrized with a shape parameter 
-            alpha (k) and a scale parameter beta (theta)
+            The gamma pdf is parametrized with a shape parameter 
+            alpha (k) and a scale parameter beta (theta),
+            see gamma_parameters for the conversion from mean and variance
 
-            For details please see
-            https://github.com/python/cpython/blob/master/Lib/random.py
-
-            param:  mean_patience - mean patience in seconds
-                    variance_patience - patience variance
+            param:  alpha - patience shape parameter
+                    beta - patience scale parameter
 
             returns - renege time
         '''
 
-        alpha = (mean_patience ** 2) / variance_patience
-        beta = variance_patience / mean_patience
-
-        return random.gammavariate(alpha, beta)
+        return self.next_gamma(alpha, beta)
 
     #---------------------------------------------------------------------------
 
-    def assign_chat_duration(self, mean_chat_duration, variance_chat_duration):
+    def assign_chat_duration(self, alpha, beta):
         '''
             Getter to assign chat duration
             chat duration follows the gamma distribution
             with alpha and beta values derived from mean and variance
-            in the OpenUp MCCIS data
+            in the OpenUp MCCIS data (see gamma_parameters)
 
-            The python gamma pdf is parametrized with a shape parameter 
-            alpha (k) and a scale parameter beta (theta)
-
-            param:  mean_chat_duration - mean chat duration in seconds
-                    variance_chat_duration - chat duration variance
+            param:  alpha - chat duration shape parameter
+                    beta - chat duration scale parameter
 
             returns - chat duration or MAX_CHAT_DURATION if chat time has exceeded
                 service standards
         '''
-        alpha = (mean_chat_duration ** 2) / variance_chat_duration
-        beta = variance_chat_duration / mean_chat_duration
-        duration = random.gammavariate(alpha, beta)
-        if duration < MAX_CHAT_DURATION:
-            return duration
-        # otherwise
-        return MAX_CHAT_DURATION
+        return min(self.next_gamma(alpha, beta), MAX_CHAT_DURATION)
 
     #---------------------------------------------------------------------------
 
-    def assign_risklevel(self, user_type):
-        '''
-            Getter to assign risklevels
-
-            param: user_type - one of either Users enum
+    def assign_user_profile(self):
         '''
-        options = list(Risklevels)
-        probability = [x.value[user_type.index][0] for x in options]
-
-        return random.choices(options, probability)[0]
+            Getter to assign user status and risklevel together
 
-    #---------------------------------------------------------------------------
+            draws from the joint distribution of the two in batches,
+            refilling the batch when it runs out
 
-    def assign_user_status(self):
-        '''
-            Getter to assign user status
+            returns - (user status, risklevel) tuple
         '''
-        options = list(Users)
-        probability = [x.value[-1][0] for x in options]
-
-        return random.choices(options, probability)[0]
+        samples = self.user_profile_samples
+        if not samples:
+            cdf = self.user_profile_cdf
+            samples.extend(np.searchsorted(cdf[:-1],
+                self.rng.random(SAMPLE_BATCH_SIZE) * cdf[-1],
+                side='right').tolist() )
+        return self.user_profile_options[samples.pop()]
 
     #---------------------------------------------------------------------------
 
     def assign_TOS_acceptance(self):
         '''
             Getter to assign TOS status
-        '''
-        
-        options = list(TOS)
-        probability = [x.value[-1] for x in options]
 
-        return random.choices(options, probability)[0]
+            acceptances are drawn in batches, refilling the batch
+            when it runs out
+        '''
+        samples = self.TOS_samples
+        if not samples:
+            samples.extend(
+                (self.rng.random(SAMPLE_BATCH_SIZE) < self.p_TOS_accepted).tolist() )
+        return self.TOS_options[samples.pop()]
 
     ############################################################################
     # File IO functions
@@ -1124,23 +1346,46 @@ class ServiceOperation:
 
     def read_interarrival_time(self):
         '''
-            file input function to read in actual interarrivals file      
+            file input function to read in actual interarrivals file
+
+            the file is parsed in a single pass on first use and shared
+            by all ServiceOperation instances afterwards (e.g. bootstraps)
+
+            returns - tuple of interarrival times, or None if the file
+                cannot be read or parsed
         '''
         try:
-            with open(NOV_INTERARRIVALS, 'r') as f:
-                interarrivals = [float(i) for i in f.readlines() ]
+            return read_interarrivals_file(NOV_INTERARRIVALS)
 
-            return interarrivals
-
-        except Exception as e:
-            print('Unable to read interarrivals file.')
+        except (OSError, ValueError) as e:
+            print(f'Unable to read interarrivals file: {e}')
+            return None
 
     ############################################################################
     # Debugging functions
     ############################################################################
 
+    def num_idle_counsellor_processes(self):
+        '''
+            returns the number of idle counsellor processes in all stores
+        '''
+
+        return sum(len(store.items)
+            for store in self.stores_counsellors_active.values() )
+
+    #---------------------------------------------------------------------------
+
     def print_idle_counsellors_working(self):
-        pprint([x.counsellor_id for x in self.store_counsellors_active.items])
+        '''
+            logs the ids of the idle counsellors in all stores
+            (the list is only built when debug logging is on)
+        '''
+        if not DEBUG:
+            return
+
+        logging.debug('Idle counsellors: %s', [x.counsellor_id
+            for store in self.stores_counsellors_active.values()
+            for x in store.items])
 
 #--------------------------------------------------end of ServiceOperation class
 
@@ -1148,28 +1393,31 @@ class ServiceOperation:
 # Main Function
 ################################################################################
 
-def main():
-    logging.debug('~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~')
-    logging.debug('Initializing OpenUp Queue Simulation')
-    logging.debug('~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~')
+@functools.lru_cache(maxsize=None)
+def fit_time_series(boxcox_lambda, ts_period, num_harmonics):
+    '''
+        fit the UCM to the boxcox transformed interarrival rates
 
-    # seed for thinning algorithm
-    thinning_random = random.Random()
-    thinning_random.seed(THINNING_SEED)
+        the fitted model is cached, so each process fits it only once
+        (e.g. the workers in run_many)
 
-    # global random seed
-    random.seed(SEED)
+        returns - fitted time series (a statsmodel object), or None if
+            the interarrivals file cannot be read
+    '''
 
-    boxcox_lambda = .5 # transformation is sqrt(y)
-    ts_period = 12
-    num_harmonics = 3
-    
+    # statsmodels, scipy.stats and pandas are only needed for fitting, so
+    # they are imported here rather than with the module
+    from statsmodels.tsa.statespace.structural import UnobservedComponents
+    from scipy.stats import boxcox
+    import pandas as pd
 
     # load time series of interarrivals (specified in SECONDS)
-    df = pd.read_csv(INTERARRIVALS_FILE, index_col=0)
-    if df is None:
-        return
-    # otherwise
+    try:
+        df = pd.read_csv(INTERARRIVALS_FILE, index_col=0)
+    except OSError as e:
+        print(f'Unable to read interarrivals file: {e}')
+        return None
+
     transformed_data = boxcox(1/df['y'], boxcox_lambda)
 
     ucm = UnobservedComponents(
@@ -1180,7 +1428,30 @@ def main():
         ],
         autoregressive=1,
     )
-    fitted_ts = ucm.fit(disp=False)
+    return ucm.fit(disp=False)
+
+#-------------------------------------------------------------------------------
+
+def main(seed=SEED, until=SIMULATION_DURATION):
+    '''
+        run a single replication of the simulation
+
+        param:  seed - seed for the numpy generator of the replication
+                until - simulation duration in minutes
+
+        returns - dict of final results, or None if no time series
+    '''
+    logging.debug('~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~')
+    logging.debug('Initializing OpenUp Queue Simulation')
+    logging.debug('~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~')
+
+    boxcox_lambda = .5 # transformation is sqrt(y)
+    ts_period = 12
+    num_harmonics = 3
+
+    fitted_ts = fit_time_series(boxcox_lambda, ts_period, num_harmonics)
+    if fitted_ts is None:
+        return None
 
 
     # # create environment
@@ -1188,10 +1459,86 @@ def main():
 
     # set up service operation and run simulation until  
     S = ServiceOperation(env=env, ts=fitted_ts, ts_period=ts_period,
-        thinning_random=thinning_random, boxcox_lambda=boxcox_lambda,
-        use_actual_interarrivals=True)
-    env.run(until=SIMULATION_DURATION)
-    # # logging.debug(S.assign_risklevel() )
+        boxcox_lambda=boxcox_lambda,
+        use_actual_interarrivals=True, seed=seed)
+    env.run(until=until)
+
+    return {
+        'num_users': S.num_users,
+        'num_users_TOS_accepted': S.num_users_TOS_accepted,
+        'num_users_TOS_rejected': S.num_users_TOS_rejected,
+        'served': S.served,
+        'served_g_repeated': S.served_by_status[Users.REPEATED.index],
+        'served_g_regular': S.served_by_status[Users.NON_REPEATED.index],
+        'reneged': S.reneged,
+        'user_queue_max_length': S.user_queue_max_length,
+        'num_queue_status': len(S.queue_status),
+    }
+
+#-------------------------------------------------------------------------------
+
+def replication_seeds(num_replications, entropy=SEED):
+    '''
+        spawn seeds for independent replications from a numpy SeedSequence,
+        so the random streams of the replications do not overlap and the
+        same entropy always gives the same seeds
+
+        param:  num_replications - number of seeds to spawn
+                entropy - entropy of the root SeedSequence
+
+        returns - list of integer seeds (see run_many)
+    '''
+
+    return [int(x.generate_state(1)[0])
+        for x in np.random.SeedSequence(entropy).spawn(num_replications)]
+
+#-------------------------------------------------------------------------------
+
+def run_many(seeds, until=SIMULATION_DURATION, nproc=None):
+    '''
+        run independent replications of the simulation in parallel, one
+        per seed.  Each worker process builds its own environment and
+        ServiceOperation, so no state is shared between replications
+
+        e.g. run_many(replication_seeds(100) )
+
+        param:  seeds - iterable of seeds, one per replication
+                until - simulation duration in minutes
+                nproc - number of worker processes
+                    if not specified, defaults to the number of cpus
+
+        returns - dict mapping each result to its (mean, variance)
+            across the replications
+    '''
+
+    with ProcessPoolExecutor(max_workers=nproc) as executor:
+        results = [x for x in executor.map(
+            functools.partial(main, until=until), seeds) if x is not None]
+
+    if not results:
+        return {}
+    # otherwise
+    return {
+        key: (
+            statistics.mean(x[key] for x in results),
+            statistics.variance([x[key] for x in results])
+                if len(results) > 1 else 0.0
+        )
+        for key in results[0]
+    }
+
+#-------------------------------------------------------------------------------
+
+def log_results(results):
+    '''
+        log the final results of a single replication (see main)
+    '''
+    if results is None:
+        return
+
+    num_users = results['num_users']
+    num_users_TOS_accepted = results['num_users_TOS_accepted']
+    served = results['served']
 
     logging.debug('\n\n\n~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~')
     logging.debug(f'Final Results ')#-- number of simultaneous chats: {MAX_NUM_SIMULTANEOUS_CHATS}')
@@ -1200,42 +1547,41 @@ def main():
 
     logging.debug(f'{Colors.HBLUE}Stage 1. TOS Acceptance{Colors.HEND}')
     try:
-        percent_accepted_TOS = S.num_users_TOS_accepted/S.num_users * 100
+        percent_accepted_TOS = num_users_TOS_accepted/num_users * 100
         percent_rejected_TOS = 100 - percent_accepted_TOS
     except ZeroDivisionError:
         percent_accepted_TOS = 0
         percent_rejected_TOS = 0
-    logging.debug(f'1. Total number of Users visited OpenUp: {S.num_users}')
-    logging.debug(f'2. Total number of Users accepted TOS: {S.num_users_TOS_accepted} ({percent_accepted_TOS:.02f}% of (1) )')
-    logging.debug(f'3. Total number of Users rejected TOS: {S.num_users_TOS_rejected} ({percent_rejected_TOS:.02f}% of (1) )\n')
+    logging.debug(f'1. Total number of Users visited OpenUp: {num_users}')
+    logging.debug(f'2. Total number of Users accepted TOS: {num_users_TOS_accepted} ({percent_accepted_TOS:.02f}% of (1) )')
+    logging.debug(f'3. Total number of Users rejected TOS: {results["num_users_TOS_rejected"]} ({percent_rejected_TOS:.02f}% of (1) )\n')
 
 
     logging.debug(f'{Colors.HBLUE}Stage 2a. Number of users served given TOS acceptance{Colors.HEND}')
     try:
-        percent_served = S.served/S.num_users_TOS_accepted * 100
-        percent_served_repeated = S.served_g_repeated/S.served * 100
-        percent_served_regular = S.served_g_regular/S.served * 100
+        percent_served = served/num_users_TOS_accepted * 100
+        percent_served_repeated = results['served_g_repeated']/served * 100
+        percent_served_regular = results['served_g_regular']/served * 100
     except ZeroDivisionError:
         percent_served = 0
         percent_served_repeated = 0
         percent_served_regular = 0
-    logging.debug(f'4. Total number of Users served: {S.served} ({percent_served:.02f}% of (2) )')
-    logging.debug(f'5. Total number of Users served -- repeated user: {S.served_g_repeated} ({percent_served_repeated:.02f}% of (4) )')
-    logging.debug(f'6. Total number of Users served -- user: {S.served_g_regular} ({percent_served_regular:.02f}% of (4) )\n')
+    logging.debug(f'4. Total number of Users served: {served} ({percent_served:.02f}% of (2) )')
+    logging.debug(f'5. Total number of Users served -- repeated user: {results["served_g_repeated"]} ({percent_served_repeated:.02f}% of (4) )')
+    logging.debug(f'6. Total number of Users served -- user: {results["served_g_regular"]} ({percent_served_regular:.02f}% of (4) )\n')
 
 
     logging.debug(f'{Colors.HBLUE}Stage 2b. Number of users reneged given TOS acceptance{Colors.HEND}')
     try:
-        percent_reneged = S.reneged/S.num_users_TOS_accepted * 100
+        percent_reneged = results['reneged']/num_users_TOS_accepted * 100
     except ZeroDivisionError:
         percent_reneged = 0
-    logging.debug(f'7. Total number of Users reneged: {S.reneged} ({percent_reneged:.02f}% of (2) )\n')
+    logging.debug(f'7. Total number of Users reneged: {results["reneged"]} ({percent_reneged:.02f}% of (2) )\n')
 
 
     logging.debug(f'{Colors.HBLUE}Queue Status{Colors.HEND}')
-    logging.debug(f'8. Maximum user queue length: {S.user_queue_max_length}')
-    logging.debug(f'9. Number of instances waiting queue is not empty after first person has been dequeued: {len(S.queue_status)}')
-    # logging.debug(f'full last debriefing duration: {S.queue_status}')
+    logging.debug(f'8. Maximum user queue length: {results["user_queue_max_length"]}')
+    logging.debug(f'9. Number of instances waiting queue is not empty after first person has been dequeued: {results["num_queue_status"]}')
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    log_results(main() )
\ No newline at end of file
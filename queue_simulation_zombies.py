@@ -19,7 +19,7 @@
     https://www.ilo.org/wcmsp5/groups/public/---ed_protect/---protrav/---travail/documents/publication/wcms_491374.pdf
 '''
 
-import simpy, random, enum, itertools, os, logging
+import simpy, random, enum, itertools, os, logging, math, functools, pickle
 from simpy.util import start_delayed
 from pprint import pprint
 from scipy.stats import beta as betavariate
@@ -39,6 +39,10 @@ logging.basicConfig(
     filename='debug.log'
 )
 
+# read once at import - the sign in, sign out and chat traces
+# below are guarded by it rather than by the logger
+DEBUG = logging.getLogger().isEnabledFor(logging.DEBUG)
+
 
 NOV_INTERARRIVALS = os.path.expanduser(
     '~/csrp/openup-queue-simulation/real_interarrivals_nov.csv')
@@ -47,6 +51,11 @@ NOV_INTERARRIVALS = os.path.expanduser(
 INTERARRIVALS_FILE = os.path.expanduser(
     '~/csrp/openup-queue-simulation/interarrivals_day_of_week_hour/Oct2020_to_Nov2020/interarrivals_day_of_week_hour.csv')
 
+# fitted time series, refitted whenever INTERARRIVALS_FILE changes
+# (set the FORCE_REFIT environment variable to refit it regardless)
+FITTED_TS_FILE = os.path.expanduser(
+    '~/csrp/openup-queue-simulation/fitted_ts.pkl')
+
 ################################################################################ 
 # Globals
 ################################################################################
@@ -63,8 +72,8 @@ MAX_SIMULTANEOUS_CHATS = {
 }    
 
 SEED = 728                                  # for seeding the global sudo-random generator
-THINNING_SEED = 305                         # for seeding the thing algo sudo-random generator
 OFFSET = 744
+MAX_TS_INDEX = 1104                         # last forecast index used for arrivals
 
 MINUTES_PER_DAY = 24 * MINUTES_PER_HOUR     # 1440 minutes per day
 SIMULATION_DURATION = MINUTES_PER_DAY * 30  # currently given as num minutes 
@@ -91,6 +100,8 @@ MAX_CHAT_DURATION = 60 * 11                 # longest chat duration is 11 hours
 
 VALIDATE_CHAT_THRESHOLD = 7.5               # time elapsed in minutes to have a pingpong>=4 
 
+SAMPLE_BATCH_SIZE = 4096                    # number of uniform variates drawn at a time
+
 ################################################################################
 # Enums, structs and constants
 ################################################################################
@@ -295,6 +306,50 @@ class TOS(enum.Enum):
         self.status = status
         self.probability = probability
 
+################################################################################
+# File IO
+################################################################################
+
+@functools.lru_cache(maxsize=None)
+def read_interarrivals_file(filename):
+    '''
+        reads in an interarrivals file, one interarrival time per line
+
+        param:
+            filename - path to the interarrivals file
+
+        returns - tuple of interarrival times
+    '''
+
+    # parsed in C by numpy, then kept as python floats for scalar access
+    return tuple(np.loadtxt(filename, dtype=np.float64, ndmin=1).tolist() )
+
+################################################################################
+# Forecasts
+################################################################################
+
+@functools.lru_cache(maxsize=None)
+def forecast_arrival_rates(ts, boxcox_lambda):
+    '''
+        forecasts the arrival rates up to MAX_TS_INDEX, back transformed
+        if a boxcox lambda is given
+
+        the forecast is cached, so runs sharing a fitted time series
+        only compute it once
+
+        param:
+            ts - fitted time series model (a statsmodel object)
+            boxcox_lambda - the fitted lambda variable, or None
+
+        returns - read-only float64 array indexed by the time series index
+    '''
+    arrival_rates = np.asarray(ts.predict(
+        start=0, end=MAX_TS_INDEX+OFFSET), dtype=np.float64)
+    if boxcox_lambda is not None:
+        arrival_rates = inv_boxcox(arrival_rates, boxcox_lambda)
+    arrival_rates.setflags(write=False)
+    return arrival_rates
+
 ################################################################################
 # Classes
 ################################################################################
@@ -307,6 +362,8 @@ class Counsellor:
         and an adhoc duty shift (if available)
     '''
 
+    __slots__ = ('env', 'counsellor_id', 'counsellor_shift', 'client_id')
+
     def __init__(self, env, counsellor_id, counsellor_shift):
         '''
             param:
@@ -319,20 +376,7 @@ class Counsellor:
         self.env = env
         self.counsellor_id = counsellor_id
         self.counsellor_shift = counsellor_shift
-        self.client_id = None # stores client id for interrupting chats
-
-    ############################################################################
-    # Properties (for encapsulation)
-    ############################################################################
-
-    @property
-    def client_id(self):
-        return self.__client_id
-
-    @client_id.setter
-    def client_id(self, value):
-        if isinstance(value, (int, type(None) ) ):
-            self.__client_id = value
+        self.client_id = None # stores client (user) id for interrupting chats
 
     def reset(self):
         self.client_id = None
@@ -348,17 +392,31 @@ class ServiceOperation:
         process
     '''
 
+    # options and probabilities for the discrete distribution getters,
+    # tabulated once per class instead of on every draw
+    p_TOS_accepted = TOS.TOS_ACCEPTED.probability / sum(
+        x.probability for x in TOS)
+    TOS_options = (TOS.TOS_REJECTED, TOS.TOS_ACCEPTED) # indexed by acceptance
+
+    # joint distribution of (user status, risklevel) pairs, so both can
+    # be drawn with a single batched sample per user (see assign_user_profile)
+    user_profile_options = tuple(itertools.product(Users, Risklevels))
+    # (risklevel probabilities are normalized per user status)
+    user_profile_cdf = np.cumsum([u.probability * x.value[u.index][0]
+        / sum(y.value[u.index][0] for y in Risklevels)
+        for u, x in user_profile_options])
+
     def __init__(self, *, env, 
         volunteer_shifts,
         duty_officer_shifts,
         social_worker_shifts,
-        ts, ts_period, thinning_random,
+        ts, ts_period,
         boxcox_lambda=None, 
         postchat_fillout_time_if_served=POSTCHAT_FILLOUT_TIME_IF_SERVED,
         postchat_fillout_time_if_reneged=POSTCHAT_FILLOUT_TIME_IF_RENEGED,
         meal_break_duration=MEAL_BREAK_DURATION,
         valid_chat_threshold=VALIDATE_CHAT_THRESHOLD,
-        use_actual_interarrivals=False):
+        use_actual_interarrivals=False, seed=SEED):
 
         '''
             init function
@@ -386,18 +444,35 @@ class ServiceOperation:
                     If not specified, defaults to MEAL_BREAK_DURATION
 
                 valid_chat_threshold - how much time elapsed before case is counted as valid chat
+
+                seed - seed for the numpy generator used by the discrete
+                    distribution getters
         '''
 
+        # None falls back to the time series (see assign_interarrival_time)
+        self.interarrivals = None
         if use_actual_interarrivals:
             self.interarrivals = self.read_interarrival_time()
 
         self.time_series = ts
         self.time_series_period = ts_period
         self.boxcox_lambda = boxcox_lambda
-        self.thinning_random = thinning_random
+
+        # forecast the arrival rates once as a flat float64 array
+        # indexed by the time series index (see assign_interarrival_time)
+        # instead of calling predict on every arrival
+        self.arrival_rates = None
+        if ts is not None:
+            self.arrival_rates = forecast_arrival_rates(ts, boxcox_lambda)
 
         self.valid_chat_threshold = valid_chat_threshold
 
+        # samples for the discrete distribution getters, drawn in
+        # batches from a seeded numpy generator and popped off per draw
+        self.rng = np.random.default_rng(seed)
+        self.TOS_samples = []
+        self.user_profile_samples = []
+
         self.env = env
 
         self.__counsellor_postchat_survey_time_if_served = postchat_fillout_time_if_served
@@ -405,7 +480,7 @@ class ServiceOperation:
         self.__meal_break = meal_break_duration
 
 
-        # counters and flags (also see properties section)
+        # counters and flags
         self.num_users = 0 # to be changed in create_users()
         self.num_users_TOS_accepted = 0
         self.num_users_TOS_rejected = 0
@@ -539,83 +614,6 @@ class ServiceOperation:
         # logging.debug(self.user_procs)
 
 
-    ############################################################################
-    # Properties (for encapsulation)
-    ############################################################################
-
-    @property
-    def user_queue_max_length(self):
-        return self.__user_queue_max_length
-
-    @property
-    def num_users(self):
-        return self.__num_users
-
-    @property
-    def reneged(self):
-        return self.__reneged
-
-    @property
-    def reneged_during_transfer(self):
-        return self.__reneged_during_transfer
-
-    @property
-    def served(self):
-        return self.__served
-
-    @property
-    def served_g_repeated(self):
-        return self.__served_g_repeated
-
-    @property
-    def served_g_regular(self):
-        return self.__served_g_regular
-
-    @property
-    def served_g_valid(self):
-        return self.__served_g_valid
-    
-    @property
-    def case_chat_time(self):
-        return self.__case_chat_time
-    
-
-    @user_queue_max_length.setter
-    def user_queue_max_length(self, value):
-        self.__user_queue_max_length = value
-
-    @num_users.setter
-    def num_users(self, value):
-        self.__num_users = value
-
-    @reneged.setter
-    def reneged(self, value):
-        self.__reneged = value
-
-    @reneged_during_transfer.setter
-    def reneged_during_transfer(self, value):
-        self.__reneged_during_transfer = value
-
-    @served.setter
-    def served(self, value):
-        self.__served = value
-
-    @served_g_repeated.setter
-    def served_g_repeated(self, value):
-        self.__served_g_repeated = value
-
-    @served_g_regular.setter
-    def served_g_regular(self, value):
-        self.__served_g_regular = value
-
-    @served_g_valid.setter
-    def served_g_valid(self, value):
-        self.__served_g_valid = value   
-
-    @case_chat_time.setter
-    def case_chat_time(self, value):
-        self.__case_chat_time = value
-
     ############################################################################
     # counsellor related functions
     ############################################################################
@@ -672,15 +670,17 @@ class ServiceOperation:
                 yield self.store_counsellors_active.put(counsellor)
 
                 if start_shift_time > 0:
-                    logging.debug(f'{Colors.GREEN}+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++{Colors.WHITE}')
-                    logging.debug(f'{Colors.GREEN}Counsellor {counsellor.counsellor_id} signed in at t = {start_shift_time}({start_shift_time%MINUTES_PER_DAY:.3f}){Colors.WHITE}')
-                    logging.debug(f'{Colors.GREEN}+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++{Colors.WHITE}\n')
+                    if DEBUG:
+                        logging.debug(f'{Colors.GREEN}+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++{Colors.WHITE}')
+                        logging.debug(f'{Colors.GREEN}Counsellor {counsellor.counsellor_id} signed in at t = {start_shift_time}({start_shift_time%MINUTES_PER_DAY:.3f}){Colors.WHITE}')
+                        logging.debug(f'{Colors.GREEN}+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++{Colors.WHITE}\n')
                 
                     # assert start_shift_time % MINUTES_PER_DAY == counsellor_shift.start or start_shift_time == 0
                     # assert counsellor in self.store_counsellors_active.items
 
-            logging.debug(f'Signed in shift:{counsellor_shift.shift.name} at {start_shift_time}({int(((start_shift_time)%MINUTES_PER_DAY)//60)%24}).'
-                f'  There are {len(self.store_counsellors_active.items)} idle SO counsellor processes:')
+            if DEBUG:
+                logging.debug(f'Signed in shift:{counsellor_shift.shift.name} at {start_shift_time}({int(((start_shift_time)%MINUTES_PER_DAY)//60)%24}).'
+                    f'  There are {len(self.store_counsellors_active.items)} idle SO counsellor processes:')
             self.log_idle_counsellors_working()
 
             if counsellor_shift.is_edge_case and counsellor_init:
@@ -716,20 +716,23 @@ class ServiceOperation:
             counsellors_still_serving = set(self.counsellors[counsellor_shift.role][counsellor_shift.shift]).difference(
                 set(self.store_counsellors_active.items) )
             if len(counsellors_still_serving) > 0:
-                logging.debug(f'{Colors.BLUE}--------------INCOMPLETE {counsellor_shift.shift.name} {self.env.now} ({self.env.now%MINUTES_PER_DAY})--------------{Colors.WHITE}')
-                # logging.debug([c.counsellor_id for c in self.counsellors[shift]])
-                logging.debug([c.counsellor_id for c in counsellors_still_serving])
+                if DEBUG:
+                    logging.debug(f'{Colors.BLUE}--------------INCOMPLETE {counsellor_shift.shift.name} {self.env.now} ({self.env.now%MINUTES_PER_DAY})--------------{Colors.WHITE}')
+                    # logging.debug([c.counsellor_id for c in self.counsellors[shift]])
+                    logging.debug([c.counsellor_id for c in counsellors_still_serving])
                 self.log_idle_counsellors_working()
 
                 try:
                     self.user_procs.interrupt((JobStates.SIGNOUT, counsellors_still_serving) ) # throw an interrupt
-                    logging.debug(f'{Colors.RED}@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@{Colors.WHITE}')
-                    logging.debug(f'@@@@ Interrupt user process handled by {counsellors_still_serving} @@@@')
-                    logging.debug(f'{Colors.RED}@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@{Colors.WHITE}')
+                    if DEBUG:
+                        logging.debug(f'{Colors.RED}@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@{Colors.WHITE}')
+                        logging.debug(f'@@@@ Interrupt user process handled by {counsellors_still_serving} @@@@')
+                        logging.debug(f'{Colors.RED}@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@{Colors.WHITE}')
                 except RuntimeError:
-                    logging.debug(f'{Colors.BLUE}@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@{Colors.WHITE}')
-                    logging.debug(f'@@@@ Cannot interrupt user process handled by {counsellors_still_serving} as it is already completed. @@@@')
-                    logging.debug(f'{Colors.BLUE}@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@{Colors.WHITE}')
+                    if DEBUG:
+                        logging.debug(f'{Colors.BLUE}@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@{Colors.WHITE}')
+                        logging.debug(f'@@@@ Cannot interrupt user process handled by {counsellors_still_serving} as it is already completed. @@@@')
+                        logging.debug(f'{Colors.BLUE}@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@{Colors.WHITE}')
                 
             total_procs_remaining = total_procs - len(counsellors_still_serving)
             counsellor_procs = [self.store_counsellors_active.get(
@@ -738,20 +741,22 @@ class ServiceOperation:
 
             # wait for all procs
             counsellor = yield AllOf(self.env, counsellor_procs)
-            counsellor_instances = [counsellor[list(counsellor)[i]] for i in range(total_procs_remaining)]
+            counsellor_instances = list(counsellor.values())
 
             end_shift_time = self.env.now
 
             for c in counsellor_instances:
                 c.reset() # set break flags
-                logging.debug(f'{Colors.RED}--------------------------------------------------------------------------{Colors.WHITE}')
-                logging.debug(f'{Colors.RED}Counsellor {c.counsellor_id} signed out at t = {end_shift_time:.3f} ({end_shift_time%MINUTES_PER_DAY:.3f}).{Colors.WHITE}')
-                logging.debug(f'{Colors.RED}--------------------------------------------------------------------------{Colors.WHITE}\n')
+                if DEBUG:
+                    logging.debug(f'{Colors.RED}--------------------------------------------------------------------------{Colors.WHITE}')
+                    logging.debug(f'{Colors.RED}Counsellor {c.counsellor_id} signed out at t = {end_shift_time:.3f} ({end_shift_time%MINUTES_PER_DAY:.3f}).{Colors.WHITE}')
+                    logging.debug(f'{Colors.RED}--------------------------------------------------------------------------{Colors.WHITE}\n')
                 # assert end_shift_time % MINUTES_PER_DAY == counsellor_shift.start or end_shift_time == 0
                 # assert c not in self.store_counsellors_active.items            
 
-            logging.debug(f'Signed out shift:{counsellor_shift.shift.name} at {end_shift_time}({int((int(end_shift_time)%MINUTES_PER_DAY)/60)%24}).'
-                f'  There are {len(self.store_counsellors_active.items)} idle SO counsellor processes:\n')
+            if DEBUG:
+                logging.debug(f'Signed out shift:{counsellor_shift.shift.name} at {end_shift_time}({int((int(end_shift_time)%MINUTES_PER_DAY)/60)%24}).'
+                    f'  There are {len(self.store_counsellors_active.items)} idle SO counsellor processes:\n')
             self.log_idle_counsellors_working()
 
             # repeat every 24 hours - overtime
@@ -777,20 +782,23 @@ class ServiceOperation:
             counsellors_still_serving = set(self.counsellors[counsellor_shift.role][counsellor_shift.shift]).difference(
                 set(self.store_counsellors_active.items) )
             if len(counsellors_still_serving) > 0:
-                logging.debug(f'{Colors.BLUE}--------------INCOMPLETE {counsellor_shift.shift.name} {self.env.now} ({self.env.now%MINUTES_PER_DAY})--------------{Colors.WHITE}')
-                # logging.debug([c.counsellor_id for c in self.counsellors[counsellor_shift.shift]])
-                logging.debug([c.counsellor_id for c in counsellors_still_serving])
+                if DEBUG:
+                    logging.debug(f'{Colors.BLUE}--------------INCOMPLETE {counsellor_shift.shift.name} {self.env.now} ({self.env.now%MINUTES_PER_DAY})--------------{Colors.WHITE}')
+                    # logging.debug([c.counsellor_id for c in self.counsellors[counsellor_shift.shift]])
+                    logging.debug([c.counsellor_id for c in counsellors_still_serving])
                 self.log_idle_counsellors_working()
 
                 try:
                     self.user_procs.interrupt((JobStates.MEAL_BREAK, counsellors_still_serving) ) # throw an interrupt
-                    logging.debug(f'{Colors.RED}@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@{Colors.WHITE}')
-                    logging.debug(f'@@@@ Interrupt user process handled by {counsellors_still_serving} @@@@')
-                    logging.debug(f'{Colors.RED}@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@{Colors.WHITE}')
+                    if DEBUG:
+                        logging.debug(f'{Colors.RED}@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@{Colors.WHITE}')
+                        logging.debug(f'@@@@ Interrupt user process handled by {counsellors_still_serving} @@@@')
+                        logging.debug(f'{Colors.RED}@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@{Colors.WHITE}')
                 except RuntimeError:
-                    logging.debug(f'{Colors.BLUE}@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@{Colors.WHITE}')
-                    logging.debug(f'@@@@ Cannot interrupt user process handled by {counsellors_still_serving} as it is already completed. @@@@')
-                    logging.debug(f'{Colors.BLUE}@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@{Colors.WHITE}')
+                    if DEBUG:
+                        logging.debug(f'{Colors.BLUE}@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@{Colors.WHITE}')
+                        logging.debug(f'@@@@ Cannot interrupt user process handled by {counsellors_still_serving} as it is already completed. @@@@')
+                        logging.debug(f'{Colors.BLUE}@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@{Colors.WHITE}')
                 
             total_procs_remaining = total_procs - len(counsellors_still_serving)
             counsellor_procs = [self.store_counsellors_active.get(
@@ -799,21 +807,23 @@ class ServiceOperation:
 
             # wait for all procs
             counsellor = yield AllOf(self.env, counsellor_procs)
-            counsellor_instances = [counsellor[list(counsellor)[i]] for i in range(total_procs_remaining)]
+            counsellor_instances = list(counsellor.values())
 
             break_init_time = self.env.now
 
             for c in counsellor_instances:
                 c.reset() # set break flags
-                logging.debug(f'{Colors.BLUE}**************************************************************************{Colors.WHITE}')
-                logging.debug(f'{Colors.BLUE}Counsellor {c.counsellor_id} AFK at t = {break_init_time:.3f} ({break_init_time%MINUTES_PER_DAY:.3f}).{Colors.WHITE}')
-                logging.debug(f'{Colors.BLUE}**************************************************************************{Colors.WHITE}\n')
+                if DEBUG:
+                    logging.debug(f'{Colors.BLUE}**************************************************************************{Colors.WHITE}')
+                    logging.debug(f'{Colors.BLUE}Counsellor {c.counsellor_id} AFK at t = {break_init_time:.3f} ({break_init_time%MINUTES_PER_DAY:.3f}).{Colors.WHITE}')
+                    logging.debug(f'{Colors.BLUE}**************************************************************************{Colors.WHITE}\n')
 
                 # assert end_shift_time % MINUTES_PER_DAY == shift.start or end_shift_time == 0
                 # assert c not in self.store_counsellors_active.items            
 
-            logging.debug(f'Shift {counsellor_shift.shift.name} taking meal break at {break_init_time}({int((int(break_init_time)%MINUTES_PER_DAY)/60)%24}).'
-                f'  There are {len(self.store_counsellors_active.items)} idle SO counsellor processes:\n')
+            if DEBUG:
+                logging.debug(f'Shift {counsellor_shift.shift.name} taking meal break at {break_init_time}({int((int(break_init_time)%MINUTES_PER_DAY)/60)%24}).'
+                    f'  There are {len(self.store_counsellors_active.items)} idle SO counsellor processes:\n')
             self.log_idle_counsellors_working()
 
             # repeat every 24 hours
@@ -838,15 +848,17 @@ class ServiceOperation:
             for counsellor in self.counsellors[counsellor_shift.role][counsellor_shift.shift]:
                 yield self.store_counsellors_active.put(counsellor)
 
-                logging.debug(f'{Colors.BLUE}##########################################################################{Colors.WHITE}')
-                logging.debug(f'{Colors.BLUE}Counsellor {counsellor.counsellor_id} BAK at t = {end_break_time}({end_break_time%MINUTES_PER_DAY:.3f}){Colors.WHITE}')
-                logging.debug(f'{Colors.BLUE}##########################################################################{Colors.WHITE}\n')
+                if DEBUG:
+                    logging.debug(f'{Colors.BLUE}##########################################################################{Colors.WHITE}')
+                    logging.debug(f'{Colors.BLUE}Counsellor {counsellor.counsellor_id} BAK at t = {end_break_time}({end_break_time%MINUTES_PER_DAY:.3f}){Colors.WHITE}')
+                    logging.debug(f'{Colors.BLUE}##########################################################################{Colors.WHITE}\n')
                 
                 # assert start_shift_time % MINUTES_PER_DAY == counsellor_shift.start or start_shift_time == 0
                 # assert counsellor in self.store_counsellors_active.items
 
-            logging.debug(f'Shift {counsellor_shift.shift.name} resumed at {end_break_time}({int(((end_break_time)%MINUTES_PER_DAY)//60)%24}).'
-                f'  There are {len(self.store_counsellors_active.items)} idle SO counsellor processes:')
+            if DEBUG:
+                logging.debug(f'Shift {counsellor_shift.shift.name} resumed at {end_break_time}({int(((end_break_time)%MINUTES_PER_DAY)//60)%24}).'
+                    f'  There are {len(self.store_counsellors_active.items)} idle SO counsellor processes:')
             self.log_idle_counsellors_working()
 
             # repeat every 24 hours
@@ -889,9 +901,10 @@ class ServiceOperation:
                                 try:
                                     self.user_handler[c.client_id%LEN_CIRCULAR_ARRAY].interrupt((cause, c) )
                                 except RuntimeError:
-                                    logging.debug(f'{Colors.BLUE}**************************************************************************{Colors.HEND}')
-                                    logging.debug(f'{Colors.BLUE}User {c.client_id} process cannot be interrupted{Colors.HEND}')
-                                    logging.debug(f'{Colors.BLUE}**************************************************************************{Colors.HEND}\n')
+                                    if DEBUG:
+                                        logging.debug(f'{Colors.BLUE}**************************************************************************{Colors.HEND}')
+                                        logging.debug(f'{Colors.BLUE}User {c.client_id} process cannot be interrupted{Colors.HEND}')
+                                        logging.debug(f'{Colors.BLUE}**************************************************************************{Colors.HEND}\n')
 
                     interarrival_time -= self.env.now - start_time # reset timeout
                     interarrival_time = max(0, interarrival_time) # make sure interarrival_time >=0
@@ -909,17 +922,19 @@ class ServiceOperation:
                     self.handle_user(uid)
                 )
 
-                logging.debug(f'{Colors.GREEN}**************************************************************************{Colors.HEND}')
-                logging.debug(f'{Colors.GREEN}User {uid} has just accepted TOS.  Chat session created at '
-                    f'{self.env.now:.3f}{Colors.HEND}')
-                logging.debug(f'{Colors.GREEN}**************************************************************************{Colors.HEND}\n')
+                if DEBUG:
+                    logging.debug(f'{Colors.GREEN}**************************************************************************{Colors.HEND}')
+                    logging.debug(f'{Colors.GREEN}User {uid} has just accepted TOS.  Chat session created at '
+                        f'{self.env.now:.3f}{Colors.HEND}')
+                    logging.debug(f'{Colors.GREEN}**************************************************************************{Colors.HEND}\n')
 
             else: # if TOS.TOS_REJECTED
                 self.num_users_TOS_rejected += 1
 
-                logging.debug(f'{Colors.BLUE}**************************************************************************{Colors.HEND}')
-                logging.debug(f'{Colors.BLUE}User {uid} rejected TOS at {self.env.now}{Colors.HEND}')
-                logging.debug(f'{Colors.BLUE}**************************************************************************{Colors.HEND}\n')
+                if DEBUG:
+                    logging.debug(f'{Colors.BLUE}**************************************************************************{Colors.HEND}')
+                    logging.debug(f'{Colors.BLUE}User {uid} rejected TOS at {self.env.now}{Colors.HEND}')
+                    logging.debug(f'{Colors.BLUE}**************************************************************************{Colors.HEND}\n')
 
         # otherwise, do nothing
     #---------------------------------------------------------------------------
@@ -965,8 +980,7 @@ class ServiceOperation:
                 r for r in Roles if r is not Roles.DUTY_OFFICER]
 
 
-        user_status = self.assign_user_status()
-        risklevel = self.assign_risklevel(user_status)
+        user_status, risklevel = self.assign_user_profile()
         renege_time = self.assign_renege_time(user_status.mean_patience)
         # renege_time = self.assign_renege_time(
         #     user_status.alpha_renege_time,
@@ -1053,9 +1067,10 @@ class ServiceOperation:
             if current_user_queue_length > self.user_queue_max_length:
                 self.user_queue_max_length = current_user_queue_length
 
-                logging.debug(f'Updated max queue length to '
-                    f'{self.user_queue_max_length}.\n'
-                    f'User Queue: {self.user_queue}\n\n\n')
+                if DEBUG:
+                    logging.debug(f'Updated max queue length to '
+                        f'{self.user_queue_max_length}.\n'
+                        f'User Queue: {self.user_queue}\n\n\n')
 
             # update queue status
             if current_user_queue_length >= QUEUE_THRESHOLD:
@@ -1064,11 +1079,12 @@ class ServiceOperation:
                 weekday = int(current_time / MINUTES_PER_DAY) % DAYS_IN_WEEK
                 hour = int(current_day_minutes / MINUTES_PER_HOUR)
 
-                logging.debug(
-                    f'Weekday: {weekday} - '
-                    f'Hour: {hour}, '
-                    f'Queue Length: {current_user_queue_length}'
-                )
+                if DEBUG:
+                    logging.debug(
+                        f'Weekday: {weekday} - '
+                        f'Hour: {hour}, '
+                        f'Queue Length: {current_user_queue_length}'
+                    )
 
                 self.queue_status.append({
                     'weekday': weekday,
@@ -1076,7 +1092,8 @@ class ServiceOperation:
                     'queue_length': current_user_queue_length
                 })
 
-            logging.debug(f'Current User Queue contains: {self.user_queue}')
+            if DEBUG:
+                logging.debug(f'Current User Queue contains: {self.user_queue}')
 
 
 
@@ -1103,13 +1120,14 @@ class ServiceOperation:
                         self.served_g_valid += 1
                     log_string = f'{Colors.HBLUE}The session lasted {cumulative_chat_time:.3f} minutes.\n\n{Colors.HEND}'
 
-                logging.debug(f'{Colors.HRED}**************************************************************************{Colors.HEND}')
-                logging.debug(f'{Colors.HRED}User {user_id} reneged after '
-                    f'spending t = {renege_time:.3f} minutes in the queue.{Colors.HEND}')
-                logging.debug(log_string)
-                logging.debug(f'{Colors.HRED}**************************************************************************{Colors.HEND}\n')
+                if DEBUG:
+                    logging.debug(f'{Colors.HRED}**************************************************************************{Colors.HEND}')
+                    logging.debug(f'{Colors.HRED}User {user_id} reneged after '
+                        f'spending t = {renege_time:.3f} minutes in the queue.{Colors.HEND}')
+                    logging.debug(log_string)
+                    logging.debug(f'{Colors.HRED}**************************************************************************{Colors.HEND}\n')
 
-                logging.debug(f'Users in system: {self.users_in_system}')
+                    logging.debug(f'Users in system: {self.users_in_system}')
 
 
                 # wait for counsellor to enter chatroom and terminate case
@@ -1130,10 +1148,11 @@ class ServiceOperation:
                         
                     except simpy.Interrupt as si:
                         if isinstance(si.cause, tuple) and si.cause[0] in [JobStates.SIGNOUT, JobStates.MEAL_BREAK]:
-                            logging.debug(f'{Colors.YELLOW}**************************************************************************{Colors.HEND}')
-                            logging.debug(f'{Colors.YELLOW}Counsellor {counsellor_instance.counsellor_id} left User {user_id}\'s\n'
-                                f'reneged counselling session and {si.cause[0].status} at {self.env.now:.3f} ({self.env.now%MINUTES_PER_DAY:.3f}).\n{Colors.HEND}')
-                            logging.debug(f'{Colors.YELLOW}**************************************************************************{Colors.HEND}\n')
+                            if DEBUG:
+                                logging.debug(f'{Colors.YELLOW}**************************************************************************{Colors.HEND}')
+                                logging.debug(f'{Colors.YELLOW}Counsellor {counsellor_instance.counsellor_id} left User {user_id}\'s\n'
+                                    f'reneged counselling session and {si.cause[0].status} at {self.env.now:.3f} ({self.env.now%MINUTES_PER_DAY:.3f}).\n{Colors.HEND}')
+                                logging.debug(f'{Colors.YELLOW}**************************************************************************{Colors.HEND}\n')
                             counsellor_instance.client_id = None
                     
                     else:
@@ -1144,14 +1163,15 @@ class ServiceOperation:
 
             else: # if counsellor takes in a user
                 chat_start_time = self.env.now
-                counsellor_instance = results[list(results)[0]] # unpack the counsellor instance
+                counsellor_instance = next(iter(results.values() )) # unpack the counsellor instance
                 counsellor_instance.client_id = user_id
 
 
-                logging.debug(f'{Colors.HGREEN}**************************************************************************{Colors.HEND}')
-                logging.debug(f'{Colors.HGREEN}User {user_id} is assigned to '
-                    f'{counsellor_instance.counsellor_id} at {chat_start_time:.3f}{Colors.HEND}')
-                logging.debug(f'{Colors.HGREEN}**************************************************************************{Colors.HEND}\n')
+                if DEBUG:
+                    logging.debug(f'{Colors.HGREEN}**************************************************************************{Colors.HEND}')
+                    logging.debug(f'{Colors.HGREEN}User {user_id} is assigned to '
+                        f'{counsellor_instance.counsellor_id} at {chat_start_time:.3f}{Colors.HEND}')
+                    logging.debug(f'{Colors.HGREEN}**************************************************************************{Colors.HEND}\n')
 
 
                 if not transfer_case:  
@@ -1200,7 +1220,8 @@ class ServiceOperation:
                             else:
                                 # remove user from system record
                                 self.users_in_system.remove(user_id)
-                                logging.debug(f'Users in system: {self.users_in_system}')
+                                if DEBUG:
+                                    logging.debug(f'Users in system: {self.users_in_system}')
 
                                 self.case_chat_time.append(cumulative_chat_time)
                                 if cumulative_chat_time >= self.valid_chat_threshold:
@@ -1210,11 +1231,12 @@ class ServiceOperation:
                                 log_string = f'{Colors.HBLUE}The session lasted {cumulative_chat_time:.3f} minutes.\n\n{Colors.HEND}'
 
 
-                            logging.debug(f'{Colors.HBLUE}**************************************************************************{Colors.HEND}')
-                            logging.debug(f'{Colors.HBLUE}Counsellor {counsellor_instance.counsellor_id} left User {user_id}\'s\n'
-                                f'counselling session and {si.cause[0].status} at {self.env.now:.3f} ({self.env.now%MINUTES_PER_DAY:.3f}).\n{Colors.HEND}')
-                            logging.debug(log_string)
-                            logging.debug(f'{Colors.HBLUE}**************************************************************************{Colors.HEND}\n')
+                            if DEBUG:
+                                logging.debug(f'{Colors.HBLUE}**************************************************************************{Colors.HEND}')
+                                logging.debug(f'{Colors.HBLUE}Counsellor {counsellor_instance.counsellor_id} left User {user_id}\'s\n'
+                                    f'counselling session and {si.cause[0].status} at {self.env.now:.3f} ({self.env.now%MINUTES_PER_DAY:.3f}).\n{Colors.HEND}')
+                                logging.debug(log_string)
+                                logging.debug(f'{Colors.HBLUE}**************************************************************************{Colors.HEND}\n')
 
                 
                 else:
@@ -1232,16 +1254,18 @@ class ServiceOperation:
                     if cumulative_chat_time >= self.valid_chat_threshold:
                         self.served_g_valid += 1
 
-                    logging.debug(f'{Colors.HBLUE}**************************************************************************{Colors.HEND}')
-                    logging.debug(f'{Colors.HBLUE}User {user_id}\'s counselling session lasted t = '
-                        f'{cumulative_chat_time:.3f} minutes.\nCounsellor {counsellor_instance.counsellor_id} '
-                        f'is now available at {self.env.now:.3f}.{Colors.HEND}')
-                    logging.debug(f'{Colors.HBLUE}**************************************************************************{Colors.HEND}\n')
+                    if DEBUG:
+                        logging.debug(f'{Colors.HBLUE}**************************************************************************{Colors.HEND}')
+                        logging.debug(f'{Colors.HBLUE}User {user_id}\'s counselling session lasted t = '
+                            f'{cumulative_chat_time:.3f} minutes.\nCounsellor {counsellor_instance.counsellor_id} '
+                            f'is now available at {self.env.now:.3f}.{Colors.HEND}')
+                        logging.debug(f'{Colors.HBLUE}**************************************************************************{Colors.HEND}\n')
 
 
                     # remove user from system record
                     self.users_in_system.remove(user_id)
-                    logging.debug(f'Users in system: {self.users_in_system}')
+                    if DEBUG:
+                        logging.debug(f'Users in system: {self.users_in_system}')
 
                     # counsellor resource is now available
                     yield self.store_counsellors_active.put(counsellor_instance)
@@ -1254,8 +1278,8 @@ class ServiceOperation:
 
     def assign_interarrival_time(self, idx=None):
         '''
-            Getter to assign interarrival time using Thinning Algorithm on an
-            interval-interval basis
+            Getter to assign interarrival time from the dominant
+            homogeneous Poisson Process on an interval-interval basis
             
             interarrival time follows the exponential distribution
 
@@ -1269,40 +1293,6 @@ class ServiceOperation:
 
 
 
-        def get_max_arrival_rate(start_interval, end_interval):
-            '''
-                helper function to get the arrival rate lambda at within an
-                interval range
-
-                param:  start_interval - index to start
-                        end_interval - index to end
-
-                precondition: start_interval >= end_interval
-            '''
-
-            # take the maximum arrival rate within interval
-            arrival_rate = self.time_series.predict(
-                start=start_interval+OFFSET, end=end_interval+OFFSET).max()
-            if self.boxcox_lambda is not None:
-                arrival_rate = inv_boxcox(
-                    arrival_rate, self.boxcox_lambda)
-            return arrival_rate
-
-        #-----------------------------------------------------------------------
-
-        def get_arrival_rate(interval):
-            '''
-                helper function to get the arrival rate lambda at the specific
-                interval
-
-                param:  interval - index
-            '''
-
-            return get_max_arrival_rate(interval+OFFSET, interval+OFFSET)
-
-        #-----------------------------------------------------------------------
-
-
         # cast this as integer to get a rough estimate
         # calculate the nearest hour as an integer
         # use it to access the mean interarrival time, from which the lambda
@@ -1316,55 +1306,33 @@ class ServiceOperation:
         local_max_idx_pt = int(self.time_series_period * current_weekday + nearest_two_hours)
         max_idx_start = local_max_idx_pt - 1
         max_idx_end = local_max_idx_pt + 1# self.time_series_period - 1
-        if max_idx_end > 1104:
-            max_idx_end = 1104
-
-        # generate the dominant homogeneous Poisson Process
-        max_arrival_rate = get_max_arrival_rate(max_idx_start, max_idx_end)
-        homo_interarrival_time = random.expovariate(max_arrival_rate)
+        if max_idx_end > MAX_TS_INDEX:
+            max_idx_end = MAX_TS_INDEX
+
+        # generate the dominant homogeneous Poisson Process, taking
+        # the maximum arrival rate within the interval
+        # (inv_boxcox was applied upfront - it preserves the ordering)
+        max_arrival_rate = self.arrival_rates[
+            max_idx_start+OFFSET:max_idx_end+OFFSET+1].max()
+        homo_interarrival_time = -math.log(1.0 - random.random() ) / max_arrival_rate
         return homo_interarrival_time
 
-
-        # find idx = x+t
-        next_arrival_time = current_time + homo_interarrival_time
-        next_weekday = int(next_arrival_time / MINUTES_PER_DAY)
-        next_arrival_time_day_minutes = next_arrival_time % MINUTES_PER_DAY
-        next_nearest_two_hour_interval = int(next_arrival_time_day_minutes / 120)
-        idx = int(self.time_series_period*next_weekday + next_nearest_two_hour_interval)
-    
-        # calculate lambda(x+t)
-        next_arrival_rate = get_arrival_rate(idx)
-
-        # logging.debug(f'Current time: {current_time}')
-        # logging.debug(f'Current weekday: {current_weekday}')
-
-        # logging.debug(f'Next time: {next_arrival_time}')
-        # logging.debug(f'Next weekday: {next_weekday}')
-        # logging.debug(f'Next Minutes day: {next_arrival_time_day_minutes}')
-        # logging.debug(f'Next Nearest two hour: {next_nearest_two_hour_interval}')
-        # logging.debug(f'index: {idx}')
-
-
-        # decide whether to output interarrival time
-        random_num = self.thinning_random.uniform(0, 1)
-        if random_num <= (next_arrival_rate / max_arrival_rate):
-            return homo_interarrival_time
-        return None
-
     #---------------------------------------------------------------------------
 
-    def assign_renege_time(self, mean_patience):
+    def assign_renege_time(self, mean_patience,
+        _log=math.log, _random=random.random):
         '''
             Getter to assign patience to user
-            user patience follows a beta distribution
+            user patience follows the exponential distribution
 
             param:  mean_patience - mean patience
-                    beta - beta shape parameter
-                    scale - scale to apply to the standardized beta distribution
 
             returns - renege time
+
+            (_log and _random are bound as locals for speed - do not pass)
         '''
-        renege_time = random.expovariate(1/mean_patience)
+        # same draw as random.expovariate(1/mean_patience), inlined
+        renege_time = -_log(1.0 - _random() ) * mean_patience
         if renege_time <= 0:
             return 0.1
         return renege_time
@@ -1411,39 +1379,37 @@ class ServiceOperation:
 
     #---------------------------------------------------------------------------
 
-    def assign_risklevel(self, user_type):
+    def assign_user_profile(self):
         '''
-            Getter to assign risklevels
+            Getter to assign user status and risklevel together
 
-            param: user_type - one of either Users enum
-        '''
-        options = list(Risklevels)
-        probability = [x.value[user_type.index][0] for x in options]
-
-        return random.choices(options, probability)[0]
+            draws from the joint distribution of the two in batches,
+            refilling the batch when it runs out
 
-    #---------------------------------------------------------------------------
-
-    def assign_user_status(self):
-        '''
-            Getter to assign user status
+            returns - (user status, risklevel) tuple
         '''
-        options = list(Users)
-        probability = [x.value[-1][0] for x in options]
-
-        return random.choices(options, probability)[0]
+        samples = self.user_profile_samples
+        if not samples:
+            cdf = self.user_profile_cdf
+            samples.extend(np.searchsorted(cdf[:-1],
+                self.rng.random(SAMPLE_BATCH_SIZE) * cdf[-1],
+                side='right').tolist() )
+        return self.user_profile_options[samples.pop()]
 
     #---------------------------------------------------------------------------
 
     def assign_TOS_acceptance(self):
         '''
             Getter to assign TOS status
-        '''
-        
-        options = list(TOS)
-        probability = [x.value[-1] for x in options]
 
-        return random.choices(options, probability)[0]
+            acceptances are drawn in batches, refilling the batch
+            when it runs out
+        '''
+        samples = self.TOS_samples
+        if not samples:
+            samples.extend(
+                (self.rng.random(SAMPLE_BATCH_SIZE) < self.p_TOS_accepted).tolist() )
+        return self.TOS_options[samples.pop()]
 
     ############################################################################
     # File IO functions
@@ -1451,28 +1417,39 @@ class ServiceOperation:
 
     def read_interarrival_time(self):
         '''
-            file input function to read in actual interarrivals file      
+            file input function to read in actual interarrivals file
+
+            the file is parsed on first use and shared by all
+            ServiceOperation instances afterwards
+
+            returns - tuple of interarrival times, or None if the file
+                cannot be read or parsed
         '''
         try:
-            with open(NOV_INTERARRIVALS, 'r') as f:
-                interarrivals = [float(i) for i in f.readlines() ]
-
-            return interarrivals
+            return read_interarrivals_file(NOV_INTERARRIVALS)
 
-        except Exception as e:
-            print('Unable to read interarrivals file.')
+        except (OSError, ValueError) as e:
+            print(f'Unable to read interarrivals file: {e}')
+            return None
 
     ############################################################################
     # Debugging functions
     ############################################################################
 
     def log_idle_counsellors_working(self):
-        logging.debug(f'{Colors.YELLOW}##################################{Colors.WHITE}')
-        logging.debug(f'{Colors.YELLOW}Items in Active Counsellors List:{Colors.WHITE}')
-        logging.debug(f'{Colors.YELLOW}##################################{Colors.WHITE}')
-        for x in self.store_counsellors_active.items:
-            logging.debug(f'{Colors.YELLOW}{x.counsellor_id}{Colors.WHITE}')
-        logging.debug('\n\n\n')         
+        if not DEBUG:
+            return
+
+        # logged as a single record
+        lines = [
+            f'{Colors.YELLOW}##################################{Colors.WHITE}',
+            f'{Colors.YELLOW}Items in Active Counsellors List:{Colors.WHITE}',
+            f'{Colors.YELLOW}##################################{Colors.WHITE}',
+        ]
+        lines.extend(f'{Colors.YELLOW}{x.counsellor_id}{Colors.WHITE}'
+            for x in self.store_counsellors_active.items)
+        lines.append('\n\n\n')
+        logging.debug('\n'.join(lines) )
 
 #--------------------------------------------------end of ServiceOperation class
 
@@ -1480,30 +1457,26 @@ class ServiceOperation:
 # Main Function
 ################################################################################
 
-def main():
-    logging.debug('~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~')
-    logging.debug('Initializing OpenUp Queue Simulation')
-    logging.debug('~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~')
-
-    # seed for thinning algorithm
-    thinning_random = random.Random()
-    thinning_random.seed(THINNING_SEED)
-
-    # global random seed
-    random.seed(SEED)
-    np.random.seed(SEED)
+def fit_time_series(boxcox_lambda, ts_period, num_harmonics):
+    '''
+        fit the UCM to the boxcox transformed interarrival rates
 
-    boxcox_lambda = .5 # transformation is sqrt(y)
-    ts_period = 12
-    num_harmonics = 3
-    
+        returns - fitted time series (a statsmodel object), or None if
+            the interarrivals file cannot be read
+    '''
 
     # load time series of interarrivals (specified in SECONDS)
-    df = pd.read_csv(INTERARRIVALS_FILE, index_col=0)
-    if df is None:
-        return
-    # otherwise
-    transformed_data = boxcox(1/df['y'], boxcox_lambda)
+    # (y is parsed straight to float64 by the C parser, without inference)
+    try:
+        df = pd.read_csv(INTERARRIVALS_FILE, index_col=0,
+            dtype={'y': np.float64}, engine='c')
+    except OSError as e:
+        print(f'Unable to read interarrivals file: {e}')
+        return None
+
+    # boxcox returns an ndarray either way, so skip the intermediate Series
+    transformed_data = boxcox(np.reciprocal(
+        df['y'].to_numpy(dtype=np.float64, copy=False) ), boxcox_lambda)
 
     ucm = UnobservedComponents(
         transformed_data,
@@ -1513,7 +1486,72 @@ def main():
         ],
         autoregressive=1,
     )
-    fitted_ts = ucm.fit(disp=False)
+    return ucm.fit(disp=False)
+
+#-------------------------------------------------------------------------------
+
+def load_or_fit_time_series(boxcox_lambda, ts_period, num_harmonics,
+    path=FITTED_TS_FILE):
+    '''
+        load the fitted time series pickled at path, refitting (and
+        pickling) it if the pickle is missing or unreadable, was fitted to
+        another interarrivals file (path, size or modification time) or
+        with other parameters, or the FORCE_REFIT environment variable
+        is set to a non-empty value (e.g. FORCE_REFIT=1)
+
+        returns - fitted time series (a statsmodel object), or None if
+            the interarrivals file cannot be read
+    '''
+    try:
+        source = os.stat(INTERARRIVALS_FILE)
+    except OSError as e:
+        print(f'Unable to read interarrivals file: {e}')
+        return None
+    key = (INTERARRIVALS_FILE, source.st_size, source.st_mtime_ns,
+        boxcox_lambda, ts_period, num_harmonics)
+
+    if not os.environ.get('FORCE_REFIT'):
+        try:
+            with open(path, 'rb') as f:
+                fitted_key, fitted_ts = pickle.load(f)
+            if fitted_key == key:
+                return fitted_ts
+        # unpickling a fit made under other statsmodels or numpy versions
+        # can fail in many ways (AttributeError, ImportError, TypeError...)
+        except Exception:
+            pass # missing or unreadable pickle - refit
+
+    fitted_ts = fit_time_series(boxcox_lambda, ts_period, num_harmonics)
+    if fitted_ts is not None:
+        try:
+            with open(path, 'wb') as f:
+                pickle.dump((key, fitted_ts), f,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+        except OSError:
+            logging.debug(f'Unable to cache fitted time series at {path}')
+    return fitted_ts
+
+#-------------------------------------------------------------------------------
+
+def main():
+    if DEBUG:
+        logging.debug('~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~')
+        logging.debug('Initializing OpenUp Queue Simulation')
+        logging.debug('~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~')
+
+    # global random seed
+    random.seed(SEED)
+    np.random.seed(SEED)
+
+    boxcox_lambda = .5 # transformation is sqrt(y)
+    ts_period = 12
+    num_harmonics = 3
+    
+
+    # the UCM fit is pickled, so it is only redone when the data changes
+    fitted_ts = load_or_fit_time_series(boxcox_lambda, ts_period, num_harmonics)
+    if fitted_ts is None:
+        return
 
 
     # # create environment
@@ -1562,49 +1600,44 @@ def main():
         duty_officer_shifts=duty_officer_shifts,
         social_worker_shifts=social_worker_shifts,
         ts=fitted_ts, ts_period=ts_period,
-        thinning_random=thinning_random, boxcox_lambda=boxcox_lambda,
+        boxcox_lambda=boxcox_lambda,
         use_actual_interarrivals=True, )
     env.run(until=SIMULATION_DURATION)
-    # # logging.debug(S.assign_risklevel() )
+
+    # the rest is debug reporting only
+    if not DEBUG:
+        return
 
     logging.debug('\n\n\n~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~')
     logging.debug(f'Final Results ')#-- number of simultaneous chats: {MAX_NUM_SIMULTANEOUS_CHATS}')
     logging.debug('~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~')
 
 
+    # all percentages in one pass, with 0% wherever the base count is 0
+    counts = np.array([S.num_users_TOS_accepted, S.num_users_TOS_rejected,
+        S.served, S.served_g_repeated, S.served_g_regular, S.served_g_valid,
+        S.reneged], dtype=np.float64)
+    base_counts = np.array([S.num_users, S.num_users,
+        S.num_users_TOS_accepted, S.served, S.served, S.served,
+        S.num_users_TOS_accepted], dtype=np.float64)
+    (percent_accepted_TOS, percent_rejected_TOS,
+        percent_served, percent_served_repeated, percent_served_regular,
+        percent_served_valid, percent_reneged) = (np.divide(counts, base_counts,
+            out=np.zeros_like(counts), where=base_counts!=0) * 100).tolist()
+
     logging.debug(f'{Colors.HBLUE}Stage 1. TOS Acceptance{Colors.HEND}')
-    try:
-        percent_accepted_TOS = S.num_users_TOS_accepted/S.num_users * 100
-        percent_rejected_TOS = 100 - percent_accepted_TOS
-    except ZeroDivisionError:
-        percent_accepted_TOS = 0
-        percent_rejected_TOS = 0
     logging.debug(f'1. Total number of Users visited OpenUp: {S.num_users}')
     logging.debug(f'2. Total number of Users accepted TOS: {S.num_users_TOS_accepted} ({percent_accepted_TOS:.02f}% of (1) )')
     logging.debug(f'3. Total number of Users rejected TOS: {S.num_users_TOS_rejected} ({percent_rejected_TOS:.02f}% of (1) )\n')
 
 
     logging.debug(f'{Colors.HBLUE}Stage 2a. Number of users served given TOS acceptance{Colors.HEND}')
-    try:
-        percent_served = S.served/S.num_users_TOS_accepted * 100
-        percent_served_repeated = S.served_g_repeated/S.served * 100
-        percent_served_regular = S.served_g_regular/S.served * 100
-        percent_served_valid = S.served_g_valid/S.served * 100
-    except ZeroDivisionError:
-        percent_served = 0
-        percent_served_repeated = 0
-        percent_served_regular = 0
-        percent_served_valid = 0
     logging.debug(f'4. Total number of Users served: {S.served} ({percent_served:.02f}% of (2) )')
     logging.debug(f'5. Total number of Users served -- repeated user: {S.served_g_repeated} ({percent_served_repeated:.02f}% of (4) )')
     logging.debug(f'6. Total number of Users served -- user: {S.served_g_regular} ({percent_served_regular:.02f}% of (4) )')
-    logging.debug(f'7. Total number of Users served -- cases above validation threshold: {S.served_g_valid} ({percent_served_regular:.02f}% of (4) )\n')
+    logging.debug(f'7. Total number of Users served -- cases above validation threshold: {S.served_g_valid} ({percent_served_valid:.02f}% of (4) )\n')
 
     logging.debug(f'{Colors.HBLUE}Stage 2b. Number of users reneged given TOS acceptance{Colors.HEND}')
-    try:
-        percent_reneged = S.reneged/S.num_users_TOS_accepted * 100
-    except ZeroDivisionError:
-        percent_reneged = 0
     logging.debug(f'8. Total number of Users reneged when assigned to the (first) counsellor: {S.reneged} ({percent_reneged:.02f}% of (2) )\n')
     logging.debug(f'9. Total number of Users reneged during a case transfer: {S.reneged_during_transfer}')
 
@@ -0,0 +1,58 @@
+'''
+    Statistics logs shared by queue_simulation.py and queue_simulation2.py
+
+    Each log keeps its records in a preallocated numpy (structured) array,
+    so a simulation run appends to an array instead of building up
+    a list of tuples.  pd.DataFrame turns a log view into a frame with
+    the columns of its record type.
+'''
+
+import numpy as np
+
+
+STATS_LOG_SIZE = 16384                      # initial capacity of the statistics logs
+
+# record types of the statistics logs
+QUEUE_TIME_STAT_DTYPE = np.dtype([
+    ('weekday', np.int8), ('hour', np.int8),
+    ('time_spent_in_queue', np.float64)])
+QUEUE_STATUS_DTYPE = np.dtype([
+    ('weekday', np.int8), ('hour', np.int8), ('queue_length', np.int32)])
+NUM_AVAILABLE_DTYPE = np.dtype([
+    ('time', np.float64), ('num_available', np.int16)])
+
+#-------------------------------------------------------------------------------
+
+class RecordLog:
+    '''
+    Append-only log of simulation statistics
+
+    records are kept in a preallocated numpy (structured) array
+    which doubles in size when full
+    '''
+
+    __slots__ = ('records', 'size')
+
+    def __init__(self, dtype, capacity=STATS_LOG_SIZE):
+        self.records = np.empty(capacity, dtype=dtype)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, record):
+        '''
+        param:
+            record - value, or tuple of field values in dtype order
+        '''
+        if self.size == self.records.size:
+            self.records = np.concatenate(
+                (self.records, np.empty_like(self.records) ) )
+        self.records[self.size] = record
+        self.size += 1
+
+    def view(self):
+        '''
+        returns: array of the records logged so far
+        '''
+        return self.records[:self.size]